@@ -0,0 +1,153 @@
+# Offline training of the search network from a log of clicks.
+#
+# Each line of a click log is one click:
+#
+#   wordids urlids selectedurl
+#
+# with the ids in each field separated by commas, for example
+# "12,40 3,8,19,7 19". Clicks for the same words and results share a
+# sub-network, so they are grouped together and each group is trained
+# in mini-batches. Groups whose sub-networks share a hidden node can
+# share weights, so they are trained one after another, the way
+# trainquery would, and groups that share nothing are trained in other
+# processes. The weight changes are saved in one transaction.
+
+import time
+from multiprocessing import Pool
+import numpy as np
+import nn
+
+def readclicklog(filename):
+  for line in open(filename):
+    fields=line.split()
+    if len(fields)!=3: continue
+    wordids=[int(id) for id in fields[0].split(',')]
+    urlids=[int(id) for id in fields[1].split(',')]
+    yield wordids,urlids,int(fields[2])
+
+def writeclicklog(filename,clicks):
+  out=open(filename,'a')
+  for wordids,urlids,selectedurl in clicks:
+    out.write('%s %s %d\n' % (','.join([str(id) for id in wordids]),
+                              ','.join([str(id) for id in urlids]),
+                              selectedurl))
+  out.close()
+
+# Returns {(wordids,urlids):[selectedurl,...]} with the ids sorted, so
+# the same query and results always give the same signature
+def groupclicks(clicks):
+  groups={}
+  for wordids,urlids,selectedurl in clicks:
+    key=(tuple(sorted(set(wordids))),tuple(sorted(set(urlids))))
+    groups.setdefault(key,[]).append(selectedurl)
+  return groups
+
+# Train one sub-network on its clicks and return how much the weights
+# changed. This runs in the worker processes, so it only gets arrays.
+def traingroup(task):
+  wi,wo,targets,batchsize,N=task
+  wi0,wo0=wi.copy(),wo.copy()
+  for start in range(0,len(targets),batchsize):
+    batch=targets[start:start+batchsize]
+
+    # Every click in a group has the same inputs, so one forward pass
+    # serves the whole batch
+    ah=np.tanh(wi.sum(axis=0))
+    ao=np.tanh(ah.dot(wo))
+
+    # Average the gradients of the clicks in the batch
+    output_deltas=nn.dtanh(ao)*(batch-ao).mean(axis=0)
+    hidden_deltas=nn.dtanh(ah)*wo.dot(output_deltas)
+    wo+=N*np.outer(ah,output_deltas)
+    wi+=N*hidden_deltas
+  return wi-wi0,wo-wo0
+
+# Train groups that share hidden nodes one after another. wi and wo
+# hold the weights of all of them, and each group is given as the rows
+# and columns of its own sub-network in them, with its targets.
+def traingroups(task):
+  wi,wo,groups,batchsize,N=task
+  wi0,wo0=wi.copy(),wo.copy()
+  for rows,hidden,cols,targets in groups:
+    dwi,dwo=traingroup((wi[np.ix_(rows,hidden)],wo[np.ix_(hidden,cols)],
+                        targets,batchsize,N))
+    wi[np.ix_(rows,hidden)]+=dwi
+    wo[np.ix_(hidden,cols)]+=dwo
+  return wi-wi0,wo-wo0
+
+# Returns lists of the indexes of groups joined by sharing hidden nodes
+def sharedgroups(subnets):
+  parent=range(len(subnets))
+  def find(i):
+    while parent[i]!=i: i=parent[i]
+    return i
+  owner={}
+  for i in range(len(subnets)):
+    for hiddenid in subnets[i][1]:
+      if hiddenid in owner: parent[find(i)]=find(owner[hiddenid])
+      else: owner[hiddenid]=i
+  joined={}
+  for i in range(len(subnets)): joined.setdefault(find(i),[]).append(i)
+  return [joined[i] for i in sorted(joined.keys())]
+
+def trainclicklog(net,filename,batchsize=10,N=0.5,processes=None):
+  start=time.time()
+  clicks=list(readclicklog(filename))
+  groups=groupclicks(clicks)
+  keys=sorted(groups.keys())
+
+  # Hidden nodes and sub-networks are set up here, before any weights
+  # change. New hidden nodes are committed with the weights at the end.
+  net.lock.acquire()
+  try:
+    for key in keys:
+      net.generatehiddennode(list(key[0]),list(key[1]),commit=False)
+    subnets=[(list(key[0]),net.getallhiddenids(list(key[0]),list(key[1])),list(key[1]))
+             for key in keys]
+
+    tasks=[]
+    sets=[]
+    for members in sharedgroups(subnets):
+      ids=[sorted(set(sum([subnets[i][layer] for i in members],[])))
+           for layer in range(3)]
+      index=[dict([(id,j) for (j,id) in enumerate(l)]) for l in ids]
+      wordids,hiddenids,urlids=ids
+      groupindexes=[]
+      for i in members:
+        selected=groups[keys[i]]
+        targets=np.zeros((len(selected),len(subnets[i][2])))
+        for j in range(len(selected)):
+          targets[j,subnets[i][2].index(selected[j])]=1.0
+        groupindexes.append(tuple([[index[layer][id] for id in subnets[i][layer]]
+                                   for layer in range(3)])+(targets,))
+      layers=net.getlayers()
+      tasks.append((layers[0].submatrix(wordids,hiddenids),
+                    layers[1].submatrix(hiddenids,urlids),
+                    groupindexes,batchsize,N))
+      sets.append(ids)
+  finally:
+    net.lock.release()
+
+  if processes==1:
+    deltas=map(traingroups,tasks)
+  else:
+    pool=Pool(processes)
+    deltas=pool.map(traingroups,tasks)
+    pool.close()
+    pool.join()
+
+  # Groups that don't share hidden nodes don't share weights, so the
+  # changes of each set of groups can just be added
+  changes={}
+  for (wordids,hiddenids,urlids),(dwi,dwo) in zip(sets,deltas):
+    for layer,fromids,toids,d in [(0,wordids,hiddenids,dwi),(1,hiddenids,urlids,dwo)]:
+      d=d.tolist()
+      for i in range(len(fromids)):
+        for j in range(len(toids)):
+          if d[i][j]!=0: changes[(layer,fromids[i],toids[j])]=d[i][j]
+  net.addweights(changes)
+
+  elapsed=time.time()-start
+  print 'Trained %d clicks in %d groups in %.2fs (%.0f clicks/s)' % (
+    len(clicks),len(groups),elapsed,len(clicks)/max(elapsed,0.000001))
+  return len(clicks)/max(elapsed,0.000001)
@@ -0,0 +1,80 @@
+# Text extraction benchmark over a directory of saved HTML pages.
+#
+# Times the crawler's old BeautifulSoup path against textextract in one
+# process and in a pool of processes, and prints pages/s and MB/s for
+# each. If the directory doesn't exist it is filled with made-up pages.
+#
+#   python extractbench.py [directory] [pages] [processes]
+
+import os
+import sys
+import time
+import random
+from multiprocessing import Pool
+from BeautifulSoup import BeautifulSoup
+import textextract
+
+def makecorpus(directory,npages=2000,nwords=5000):
+  random.seed(0)
+  os.makedirs(directory)
+  words=['word%d' % i for i in range(nwords)]
+  for i in range(npages):
+    paras=[]
+    for j in range(random.randint(5,40)):
+      text=' '.join([random.choice(words) for k in range(random.randint(20,80))])
+      link='<a href="/page%d.html">%s</a>' % (random.randint(0,npages-1),
+                                               random.choice(words))
+      paras.append('<p>%s %s</p>' % (text,link))
+    out=open(os.path.join(directory,'page%d.html' % i),'w')
+    out.write('<html><head><title>Page %d</title>'
+              '<script>var x=1;</script></head><body>%s</body></html>' %
+              (i,'\n'.join(paras)))
+    out.close()
+
+def loadcorpus(directory):
+  pages=[]
+  for name in sorted(os.listdir(directory)):
+    if not name.endswith('.html'): continue
+    html=open(os.path.join(directory,name)).read()
+    pages.append(('http://bench/'+name,html))
+  return pages
+
+# What crawl did for each page before textextract
+def soupextract(page):
+  url,html=page
+  soup=BeautifulSoup(html)
+  text=gettextonly(soup)
+  links=[(link['href'],gettextonly(link)) for link in soup('a')
+         if 'href' in dict(link.attrs)]
+  return url,textextract.separatewords(text),links
+
+def gettextonly(soup):
+  v=soup.string
+  if v==None:
+    return ''.join([gettextonly(t)+'\n' for t in soup.contents])
+  return v.strip()
+
+def timeextract(name,f,pages):
+  size=sum([len(html) for url,html in pages])
+  start=time.time()
+  words=sum([len(w) for url,w,links in f(pages) if w!=None])
+  elapsed=max(time.time()-start,0.000001)
+  print '%-12s %8.0f pages/s %7.2f MB/s %10d words' % (
+    name,len(pages)/elapsed,size/elapsed/1e6,words)
+
+def run(directory='extractcorpus',npages=2000,processes=None):
+  if not os.path.exists(directory):
+    print 'Writing %d pages to %s' % (npages,directory)
+    makecorpus(directory,npages)
+  pages=loadcorpus(directory)
+
+  timeextract('soup',lambda p: map(soupextract,p),pages)
+  timeextract('textextract',lambda p: map(textextract.extract,p),pages)
+  pool=Pool(processes)
+  timeextract('pool',lambda p: pool.map(textextract.extract,p,chunksize=16),pages)
+  pool.close()
+  pool.join()
+
+if __name__=='__main__':
+  args=sys.argv[1:2]+[int(a) for a in sys.argv[2:4]]
+  run(*args)
@@ -0,0 +1,219 @@
+# End-to-end benchmark for the search engine.
+#
+# Writes a made-up web of linked pages whose words follow Zipf's law,
+# serves it from a local HTTP server, and times each stage the way a
+# real index is built: crawl (download, parse and index), pagerank,
+# training the network on clicks, then queries. The queries are fired
+# from several threads at once, each with its own searcher and all
+# sharing the network, and throughput, latency percentiles and the
+# size of the database are printed at the end.
+#
+#   python loadbench.py [pages] [queries] [threads] [dbname]
+#
+# Run it from an empty directory, the searcher keeps its network in
+# nn.db in the current directory.
+
+import os
+import sys
+import time
+import random
+import threading
+import Queue
+import SocketServer
+import SimpleHTTPServer
+import numpy as np
+from pysqlite2 import dbapi2 as sqlite
+import searchengine
+
+def makevocabulary(nwords):
+  # Real words, so none of them are thrown away as numbers
+  letters='bcdfghjklmnprstvwz'
+  vowels='aeiou'
+  words=[]
+  seen=set()
+  while len(words)<nwords:
+    word=''.join([random.choice(letters)+random.choice(vowels)
+                  for i in range(random.randint(2,4))])
+    if word in seen or word in searchengine.ignorewords: continue
+    seen.add(word)
+    words.append(word)
+  return words
+
+# Probability of the n-th most common of n items under Zipf's law
+def zipfweights(n,s=1.0):
+  weights=1.0/np.arange(1,n+1)**s
+  return weights/weights.sum()
+
+def makeweb(directory,vocabulary,npages=500,pagewords=300,outlinks=8,seed=0):
+  rand=np.random.RandomState(seed)
+  os.makedirs(directory)
+  nwords=len(vocabulary)
+  wordprobs=zipfweights(nwords)
+  # Some pages are much more popular link targets than others
+  pageprobs=zipfweights(npages,0.8)
+
+  for i in range(npages):
+    words=[vocabulary[w] for w in rand.choice(nwords,pagewords,p=wordprobs)]
+    paras=[' '.join(words[j:j+50]) for j in range(0,pagewords,50)]
+    links=['<a href="page%d.html">%s</a>' %
+           (t,' '.join([vocabulary[w] for w in rand.choice(nwords,2,p=wordprobs)]))
+           for t in rand.choice(npages,outlinks,p=pageprobs)]
+    out=open(os.path.join(directory,'page%d.html' % i),'w')
+    out.write('<html><head><title>%s</title></head><body>\n' % words[0])
+    out.write('\n'.join(['<p>%s</p>' % p for p in paras]))
+    out.write('\n<p>%s</p>\n</body></html>\n' % ' '.join(links))
+    out.close()
+
+  # A start page that links to everything, so a crawl of depth 2 sees
+  # every page
+  out=open(os.path.join(directory,'index.html'),'w')
+  out.write('<html><body>%s</body></html>\n' %
+            ' '.join(['<a href="page%d.html">page</a>' % i for i in range(npages)]))
+  out.close()
+
+class pagehandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+  directory='.'
+
+  def translate_path(self,path):
+    path=path.split('?')[0].split('#')[0]
+    return os.path.join(self.directory,path.lstrip('/'))
+
+  def log_message(self,format,*args):
+    pass
+
+class pageserver(SocketServer.ThreadingMixIn,SocketServer.TCPServer):
+  daemon_threads=True
+  allow_reuse_address=True
+
+# Serve the files in directory on localhost from a background thread.
+# Call shutdown() on the result to stop it.
+def serve(directory,port=0):
+  class handler(pagehandler): pass
+  handler.directory=directory
+  server=pageserver(('127.0.0.1',port),handler)
+  thread=threading.Thread(target=server.serve_forever)
+  thread.daemon=True
+  thread.start()
+  return server
+
+# A mix of common words, rare words and pairs. Queries are drawn from
+# a smaller set with Zipf popularity, so some of them repeat the way
+# real queries do.
+def makequeries(vocabulary,nqueries,ndistinct=None):
+  if ndistinct==None: ndistinct=max(1,nqueries/4)
+  common=vocabulary[:100]
+  rare=vocabulary[100:]
+  distinct=[]
+  for i in range(ndistinct):
+    kind=random.random()
+    if kind<0.4: distinct.append(random.choice(common))
+    elif kind<0.6: distinct.append(random.choice(rare))
+    else: distinct.append('%s %s' % (random.choice(common),random.choice(vocabulary)))
+  picks=np.random.RandomState(1).choice(ndistinct,nqueries,p=zipfweights(ndistinct))
+  return [distinct[i] for i in picks]
+
+# Train the network on clicks on random results of the queries, so
+# that queries go through it
+def trainclicks(dbname,queries,clicks=500):
+  s=searchengine.searcher(dbname)
+  for i in range(clicks):
+    matches,wordids=s.getmatchrows(random.choice(queries))
+    if len(matches)==0: continue
+    urlids=random.sample(matches.keys(),min(10,len(matches)))
+    searchengine.mynet.trainquery(wordids,urlids,random.choice(urlids))
+
+def percentile(times,p):
+  times=sorted(times)
+  return times[min(len(times)-1,int(len(times)*p/100.0))]
+
+# Run the queries from nthreads threads, each with its own searcher.
+# They all use searchengine.mynet.
+# Returns the wall clock time and the latency of every query.
+def runqueries(dbname,queries,nthreads=4):
+  work=Queue.Queue()
+  for q in queries: work.put(q)
+  times=[]
+  lock=threading.Lock()
+
+  def worker():
+    s=searchengine.searcher(dbname)
+    mine=[]
+    while True:
+      try: q=work.get_nowait()
+      except Queue.Empty: break
+      start=time.time()
+      s.query(q,show=False)
+      mine.append(time.time()-start)
+    lock.acquire()
+    times.extend(mine)
+    lock.release()
+
+  start=time.time()
+  threads=[threading.Thread(target=worker) for i in range(nthreads)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  return time.time()-start,times
+
+def dbsize(dbname):
+  return sum([os.path.getsize(dbname+ext) for ext in ['','-wal']
+              if os.path.exists(dbname+ext)])
+
+def timed(f,*args):
+  start=time.time()
+  f(*args)
+  return time.time()-start
+
+def run(npages=500,nqueries=2000,nthreads=4,dbname='loadbench.db'):
+  random.seed(0)
+  vocabulary=makevocabulary(5000)
+  directory='loadweb%d' % npages
+  if not os.path.exists(directory):
+    print 'Writing %d pages to %s' % (npages,directory)
+    makeweb(directory,vocabulary,npages)
+  server=serve(directory)
+  starturl='http://127.0.0.1:%d/index.html' % server.server_address[1]
+
+  for ext in ['','-wal','-shm']:
+    if os.path.exists(dbname+ext): os.remove(dbname+ext)
+  net=searchengine.mynet
+  try: net.maketables()
+  except sqlite.OperationalError:
+    # Start from an untrained network. Our own commits don't change
+    # data_version, so drop the weights in memory by hand.
+    for table in ['hiddennode','wordhidden','hiddenurl']:
+      net.con.execute('delete from %s' % table)
+    net.con.commit()
+    net.layers=None
+
+  # The crawler prints a line per page, which isn't what's being timed
+  crawler=searchengine.crawler(dbname)
+  crawler.createindextables()
+  stdout=sys.stdout
+  sys.stdout=open(os.devnull,'w')
+  try:
+    crawltime=timed(crawler.crawl,[starturl])
+    pageranktime=timed(crawler.calculatepagerank)
+  finally:
+    sys.stdout.close()
+    sys.stdout=stdout
+  server.shutdown()
+  del crawler
+  print 'crawl     %8.2fs  %.0f pages/s' % (crawltime,npages/max(crawltime,0.000001))
+  print 'pagerank  %8.2fs' % pageranktime
+
+  queries=makequeries(vocabulary,nqueries)
+  clicks=max(1,nqueries/4)
+  traintime=timed(trainclicks,dbname,queries,clicks)
+  print 'train     %8.2fs  %.0f clicks/s' % (traintime,clicks/max(traintime,0.000001))
+
+  elapsed,times=runqueries(dbname,queries,nthreads)
+  print 'queries   %8.2fs  %.0f queries/s with %d threads' % (
+    elapsed,len(times)/max(elapsed,0.000001),nthreads)
+  print 'latency   p50 %.2fms  p90 %.2fms  p99 %.2fms' % (
+    percentile(times,50)*1000,percentile(times,90)*1000,percentile(times,99)*1000)
+  print 'database  %.1f MB, %d pages' % (dbsize(dbname)/1e6,npages)
+
+if __name__=='__main__':
+  args=[int(a) for a in sys.argv[1:4]]
+  if len(sys.argv)>4: args.append(sys.argv[4])
+  run(*args)
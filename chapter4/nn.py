@@ -1,162 +1,442 @@
-from math import tanh
-from pysqlite2 import dbapi2 as sqlite
+import math
+import threading
+import time
+import numpy as np
+import storage
 
 def dtanh(y):
     return 1.0-y*y
 
+# The weights between two layers of nodes, kept sparsely since each
+# hidden node only connects to a few words and pages. rows maps a from
+# node to {to node:strength} and cols maps a to node to the set of
+# from nodes connected to it. Connections that were never set hold the
+# default strength. dirty holds the (fromid,toid) pairs whose weights
+# have changed since they were last written to the database. colabs
+# holds the sum of the absolute weights into each to node.
+class weightmatrix:
+    def __init__(self,default):
+      self.default=default
+      self.rows={}
+      self.cols={}
+      self.colabs={}
+      self.dirty=set()
+
+    def put(self,fromid,toid,strength):
+      row=self.rows.setdefault(fromid,{})
+      change=abs(strength)-abs(row.get(toid,0.0))
+      row[toid]=strength
+      self.cols.setdefault(toid,set()).add(fromid)
+      self.colabs[toid]=self.colabs.get(toid,0.0)+change
+
+    # Adds (fromid,toid,strength) rows read from the database
+    def load(self,rows):
+      for fromid,toid,strength in rows: self.put(fromid,toid,strength)
+
+    def get(self,fromid,toid):
+      return self.rows.get(fromid,{}).get(toid,self.default)
+
+    # The weights between the given nodes, as a new array
+    def submatrix(self,fromids,toids):
+      sub=np.empty((len(fromids),len(toids)))
+      sub.fill(self.default)
+      positions={}
+      for j in range(len(toids)): positions.setdefault(toids[j],[]).append(j)
+      for i in range(len(fromids)):
+        row=self.rows.get(fromids[i])
+        if row==None: continue
+        # Look up from whichever side is smaller
+        if len(row)<len(positions):
+          found=[(toid,strength) for (toid,strength) in row.items() if toid in positions]
+        else:
+          found=[(toid,row[toid]) for toid in positions if toid in row]
+        for toid,strength in found:
+          for j in positions[toid]: sub[i,j]=strength
+      return sub
+
+    def setsubmatrix(self,fromids,toids,values):
+      values=np.asarray(values).tolist()
+      for i in range(len(fromids)):
+        for j in range(len(toids)):
+          self.put(fromids[i],toids[j],values[i][j])
+          self.dirty.add((fromids[i],toids[j]))
+
+    def add(self,fromid,toid,change):
+      self.put(fromid,toid,self.get(fromid,toid)+change)
+      self.dirty.add((fromid,toid))
+
+    # Returns (fromid,toid,strength) for every changed weight and marks
+    # them all clean again
+    def takedirty(self):
+      rows=[(fromid,toid,self.rows[fromid][toid]) for (fromid,toid) in self.dirty]
+      self.dirty=set()
+      return rows
+
+    # Ids of the to nodes connected to any of the from nodes
+    def connectedcols(self,fromids):
+      connected=set()
+      for fromid in fromids: connected.update(self.rows.get(fromid,{}))
+      return list(connected)
+
+    # Ids of the from nodes connected to any of the to nodes
+    def connectedrows(self,toids):
+      connected=set()
+      for toid in toids: connected.update(self.cols.get(toid,()))
+      return list(connected)
+
+    # True if any from node is connected to toid
+    def hascol(self,toid):
+      return len(self.cols.get(toid,()))>0
+
+# Changed weights are written back every flushevery training events.
+# With the default of 1 every click is saved as soon as it is trained,
+# larger values trade durability for fewer transactions.
+#
+# One searchnet can be shared by threads. Its connection and weights
+# are used under lock, and getresult keeps the network it runs in
+# local variables, so queries only hold the lock while they copy out
+# their weights. Training holds it throughout.
 class searchnet:
-    def __init__(self,dbname):
-      self.con=sqlite.connect(dbname)
+    def __init__(self,dbname,flushevery=1):
+      self.store=storage.getstore(dbname)
+      self.con=self.store.getconnection()
+      self.layers=None
+      self.layersversion=None
+      self.flushevery=flushevery
+      self.pending=0
+      self.updates=0
+      self.stopevent=None
+      self.lock=threading.RLock()
+      self.migrate()
   
     def __del__(self):
-      self.con.close()
+      self.stoppruning()
+      if self.layers!=None: self.flush()
+      self.store.putconnection(self.con)
+
+    # Changes whenever the weights do. data_version moves when another
+    # connection commits, updates when this one changes a weight.
+    def getversion(self):
+      self.lock.acquire()
+      try:
+        return (self.con.execute('pragma data_version').fetchone()[0],
+                self.updates)
+      finally:
+        self.lock.release()
 
+    # created and updated are when a hidden node was made and when a
+    # connection's strength was last written, which is what prune uses
+    # to find the parts of the network nobody uses
     def maketables(self):
-      self.con.execute('create table hiddennode(create_key)')
-      self.con.execute('create table wordhidden(fromid,toid,strength)')
-      self.con.execute('create table hiddenurl(fromid,toid,strength)')
+      self.con.execute('create table hiddennode(create_key,created)')
+      self.con.execute('create table wordhidden(fromid,toid,strength,updated,primary key(fromid,toid))')
+      self.con.execute('create table hiddenurl(fromid,toid,strength,updated,primary key(fromid,toid))')
+      self.con.execute('create unique index hiddenkeyidx on hiddennode(create_key)')
+      self.con.execute('create index wordhiddentoidx on wordhidden(toid)')
+      self.con.execute('create index hiddenurltoidx on hiddenurl(toid)')
       self.con.commit()
+      self.layers=None
+
+    # Brings tables made before created and updated were added up to
+    # date. Existing nodes and weights count as made and trained now,
+    # so prune doesn't drop them straight away. Does nothing to tables
+    # that are current or don't exist yet.
+    def migrate(self):
+      now=time.time()
+      changed=False
+      for table,column in [('hiddennode','created'),('wordhidden','updated'),
+                           ('hiddenurl','updated')]:
+        columns=[row[1] for row in self.con.execute('pragma table_info(%s)' % table)]
+        if len(columns)==0 or column in columns: continue
+        self.con.execute('alter table %s add column %s' % (table,column))
+        self.con.execute('update %s set %s=?' % (table,column),(now,))
+        if table=='hiddennode':
+          self.con.execute('create unique index if not exists hiddenkeyidx on hiddennode(create_key)')
+        else:
+          # flush replaces weights in place, which needs one row per
+          # connection. Keep the latest of any duplicates.
+          self.con.execute('delete from %s where rowid not in '
+                           '(select max(rowid) from %s group by fromid,toid)' % (table,table))
+          self.con.execute('create unique index if not exists %sidx on %s(fromid,toid)' % (table,table))
+          self.con.execute('create index if not exists %stoidx on %s(toid)' % (table,table))
+        changed=True
+      if changed: self.con.commit()
+
+    # Write every changed weight in one transaction
+    def flush(self):
+      self.lock.acquire()
+      try:
+        now=time.time()
+        for layer,table in [(0,'wordhidden'),(1,'hiddenurl')]:
+          rows=[row+(now,) for row in self.layers[layer].takedirty()]
+          self.con.executemany('insert or replace into %s (fromid,toid,strength,updated) values (?,?,?,?)' % table,rows)
+        self.con.commit()
+        self.pending=0
+      finally:
+        self.lock.release()
+
+    # Drop the hidden nodes none of whose connections have been trained
+    # in the last days days, and old connections whose strength is
+    # within minchange of the default, since removing those makes no
+    # difference to the network's output. With a large flushevery, keep
+    # days well above the time between flushes, or a node trained only
+    # in memory can look unused.
+    def prune(self,days=30,minchange=0.01,con=None):
+      if con==None:
+        self.lock.acquire()
+        try:
+          if self.layers!=None: self.flush()
+          return self.prune(days,minchange,self.con)
+        finally:
+          self.lock.release()
+      cutoff=time.time()-days*86400
+      stale=[row[0] for row in con.execute(
+        'select rowid from hiddennode where created<? and rowid not in '
+        '(select toid from wordhidden where updated>=? '
+        'union select fromid from hiddenurl where updated>=?)',
+        (cutoff,cutoff,cutoff))]
+
+      # Delete in batches to stay under SQLite's limit on parameters
+      for start in range(0,len(stale),500):
+        ids=stale[start:start+500]
+        marks=','.join(['?']*len(ids))
+        con.execute('delete from wordhidden where toid in (%s)' % marks,ids)
+        con.execute('delete from hiddenurl where fromid in (%s)' % marks,ids)
+        con.execute('delete from hiddennode where rowid in (%s)' % marks,ids)
+      con.execute('delete from wordhidden where updated<? and abs(strength+0.2)<?',
+                  (cutoff,minchange))
+      con.execute('delete from hiddenurl where updated<? and abs(strength)<?',
+                  (cutoff,minchange))
+      con.commit()
+
+      # Our own commits don't change data_version, so reload by hand
+      if con==self.con: self.layers=None
+      return len(stale)
+
+    # Run prune every interval seconds in a background thread. The thread
+    # has its own connection, and this one picks up the changes through
+    # data_version like any other writer's.
+    def startpruning(self,interval=3600,days=30,minchange=0.01):
+      self.stoppruning()
+      stopevent=threading.Event()
+      def run():
+        con=self.store.getconnection()
+        while not stopevent.isSet():
+          self.prune(days,minchange,con)
+          stopevent.wait(interval)
+        self.store.putconnection(con)
+      thread=threading.Thread(target=run)
+      thread.daemon=True
+      thread.start()
+      self.stopevent=stopevent
+      return thread
+
+    def stoppruning(self):
+      if self.stopevent!=None:
+        self.stopevent.set()
+        self.stopevent=None
+
+    # The word->hidden and hidden->url weights, read into memory the
+    # first time they are needed. This connection keeps them up to
+    # date as it writes, and they are read again if another
+    # connection has changed the database since.
+    def getlayers(self):
+      self.lock.acquire()
+      try:
+        version=self.con.execute('pragma data_version').fetchone()[0]
+        if self.layers==None or version!=self.layersversion:
+          # Don't lose anything still waiting to be written
+          if self.layers!=None: self.flush()
+          self.layers=[weightmatrix(-0.2),weightmatrix(0.0)]
+          for layer,table in [(0,'wordhidden'),(1,'hiddenurl')]:
+            self.layers[layer].load(
+              self.con.execute('select fromid,toid,strength from %s' % table))
+          self.layersversion=version
+        return self.layers
+      finally:
+        self.lock.release()
 
     def getstrength(self,fromid,toid,layer):
-      if layer==0: table='wordhidden'
-      else: table='hiddenurl'
-      res=self.con.execute('select strength from %s where fromid=%d and toid=%d' % (table,fromid,toid)).fetchone()
-      if res==None: 
-          if layer==0: return -0.2
-          if layer==1: return 0
-      return res[0]
+      self.lock.acquire()
+      try:
+        return self.getlayers()[layer].get(fromid,toid)
+      finally:
+        self.lock.release()
 
+    # The new strength is written to the database on the next flush
     def setstrength(self,fromid,toid,layer,strength):
-      if layer==0: table='wordhidden'
-      else: table='hiddenurl'
-      res=self.con.execute('select rowid from %s where fromid=%d and toid=%d' % (table,fromid,toid)).fetchone()
-      if res==None: 
-        self.con.execute('insert into %s (fromid,toid,strength) values (%d,%d,%f)' % (table,fromid,toid,strength))
-      else:
-        rowid=res[0]
-        self.con.execute('update %s set strength=%f where rowid=%d' % (table,strength,rowid))
-
-    def generatehiddennode(self,wordids,urls):
-      if len(wordids)>3: return None
-      # Check if we already created a node for this set of words
-      sorted_words=[str(id) for id in wordids]
-      sorted_words.sort()
-      createkey='_'.join(sorted_words)
-      res=self.con.execute(
-      "select rowid from hiddennode where create_key='%s'" % createkey).fetchone()
-
-      # If not, create it
-      if res==None:
-        cur=self.con.execute(
-        "insert into hiddennode (create_key) values ('%s')" % createkey)
-        hiddenid=cur.lastrowid
-        # Put in some default weights
-        for wordid in wordids:
-          self.setstrength(wordid,hiddenid,0,1.0/len(wordids))
-        for urlid in urls:
-          self.setstrength(hiddenid,urlid,1,0.1)
-        self.con.commit()
+      self.lock.acquire()
+      try:
+        self.getlayers()[layer].setsubmatrix([fromid],[toid],[[strength]])
+        self.updates+=1
+      finally:
+        self.lock.release()
+
+    # With commit false a new node is committed along with its weights
+    # on the next flush
+    def generatehiddennode(self,wordids,urls,commit=True):
+      self.lock.acquire()
+      try:
+        if len(wordids)>3: return None
+        # Check if we already created a node for this set of words
+        sorted_words=[str(id) for id in wordids]
+        sorted_words.sort()
+        createkey='_'.join(sorted_words)
+        res=self.con.execute(
+        'select rowid from hiddennode where create_key=?',(createkey,)).fetchone()
+
+        # If not, create it
+        if res==None:
+          cur=self.con.execute(
+          'insert into hiddennode (create_key,created) values (?,?)',
+          (createkey,time.time()))
+          hiddenid=cur.lastrowid
+          # Put in some default weights
+          for wordid in wordids:
+            self.setstrength(wordid,hiddenid,0,1.0/len(wordids))
+          for urlid in urls:
+            self.setstrength(hiddenid,urlid,1,0.1)
+          if commit: self.con.commit()
+      finally:
+        self.lock.release()
 
     def getallhiddenids(self,wordids,urlids):
-      l1={}
-      for wordid in wordids:
-        cur=self.con.execute(
-        'select toid from wordhidden where fromid=%d' % wordid)
-        for row in cur: l1[row[0]]=1
-      for urlid in urlids:
-        cur=self.con.execute(
-        'select fromid from hiddenurl where toid=%d' % urlid)
-        for row in cur: l1[row[0]]=1
-      return l1.keys()
+      self.lock.acquire()
+      try:
+        layers=self.getlayers()
+        l1={}
+        for hiddenid in layers[0].connectedcols(wordids): l1[hiddenid]=1
+        for hiddenid in layers[1].connectedrows(urlids): l1[hiddenid]=1
+        return l1.keys()
+      finally:
+        self.lock.release()
+
+    # The pages that have at least one hidden node connected to them.
+    # Every other page always gets an output of 0.
+    def getconnectedurls(self,urlids):
+      self.lock.acquire()
+      try:
+        m=self.getlayers()[1]
+        return [urlid for urlid in urlids if m.hascol(urlid)]
+      finally:
+        self.lock.release()
+
+    # An upper bound on the absolute output of each page, without
+    # running the network. A page's output is tanh of the sum of each
+    # hidden node's activation times its weight to the page, which is at
+    # most the sum of their absolute values. Hidden nodes none of the
+    # words connect to all have the same activation, so that is colabs
+    # times it, corrected for the few nodes the words do connect to.
+    def getoutputbounds(self,wordids,urlids):
+      self.lock.acquire()
+      try:
+        layers=self.getlayers()
+        hiddenids=layers[0].connectedcols(wordids)
+        ah=np.tanh(np.ones(len(wordids)).dot(layers[0].submatrix(wordids,hiddenids)))
+        a0=abs(math.tanh(layers[0].default*len(wordids)))
+        sums={}
+        for hiddenid,a in zip(hiddenids,np.abs(ah).tolist()):
+          for urlid,strength in layers[1].rows.get(hiddenid,{}).items():
+            sums[urlid]=sums.get(urlid,0.0)+(a-a0)*abs(strength)
+        colabs=layers[1].colabs
+        # A little slack for rounding
+        return [math.tanh(max(0.0,a0*colabs.get(urlid,0.0)+sums.get(urlid,0.0))*(1+1e-9)+1e-12)
+                for urlid in urlids]
+      finally:
+        self.lock.release()
+
+    # Returns the hidden nodes for a query and copies of the weights
+    # into and out of them
+    def getweights(self,wordids,urlids):
+      self.lock.acquire()
+      try:
+        hiddenids=self.getallhiddenids(wordids,urlids)
+        layers=self.getlayers()
+        return (hiddenids,layers[0].submatrix(wordids,hiddenids),
+                layers[1].submatrix(hiddenids,urlids))
+      finally:
+        self.lock.release()
 
     def setupnetwork(self,wordids,urlids):
         # value lists
         self.wordids=wordids
-        self.hiddenids=self.getallhiddenids(wordids,urlids)
         self.urlids=urlids
+        self.hiddenids,self.wi,self.wo=self.getweights(wordids,urlids)
  
         # node outputs
-        self.ai = [1.0]*len(self.wordids)
-        self.ah = [1.0]*len(self.hiddenids)
-        self.ao = [1.0]*len(self.urlids)
-        
-        # create weights matrix
-        self.wi = [[self.getstrength(wordid,hiddenid,0) 
-                    for hiddenid in self.hiddenids] 
-                   for wordid in self.wordids]
-        self.wo = [[self.getstrength(hiddenid,urlid,1) 
-                    for urlid in self.urlids] 
-                   for hiddenid in self.hiddenids]
+        self.ai = np.ones(len(self.wordids))
+        self.ah = np.ones(len(self.hiddenids))
+        self.ao = np.ones(len(self.urlids))
 
     def feedforward(self):
         # the only inputs are the query words
-        for i in range(len(self.wordids)):
-            self.ai[i] = 1.0
+        self.ai[:] = 1.0
 
         # hidden activations
-        for j in range(len(self.hiddenids)):
-            sum = 0.0
-            for i in range(len(self.wordids)):
-                sum = sum + self.ai[i] * self.wi[i][j]
-            self.ah[j] = tanh(sum)
+        self.ah = np.tanh(self.ai.dot(self.wi))
 
         # output activations
-        for k in range(len(self.urlids)):
-            sum = 0.0
-            for j in range(len(self.hiddenids)):
-                sum = sum + self.ah[j] * self.wo[j][k]
-            self.ao[k] = tanh(sum)
+        self.ao = np.tanh(self.ah.dot(self.wo))
 
-        return self.ao[:]
+        return self.ao.tolist()
 
+    # The same as setupnetwork and feedforward, without keeping anything
+    # on self, so threads can run queries at the same time
     def getresult(self,wordids,urlids):
-      self.setupnetwork(wordids,urlids)
-      return self.feedforward()
+      hiddenids,wi,wo=self.getweights(wordids,urlids)
+      ah=np.tanh(np.ones(len(wordids)).dot(wi))
+      return np.tanh(ah.dot(wo)).tolist()
 
     def backPropagate(self, targets, N=0.5):
         # calculate errors for output
-        output_deltas = [0.0] * len(self.urlids)
-        for k in range(len(self.urlids)):
-            error = targets[k]-self.ao[k]
-            output_deltas[k] = dtanh(self.ao[k]) * error
+        output_deltas = dtanh(self.ao) * (np.asarray(targets)-self.ao)
 
         # calculate errors for hidden layer
-        hidden_deltas = [0.0] * len(self.hiddenids)
-        for j in range(len(self.hiddenids)):
-            error = 0.0
-            for k in range(len(self.urlids)):
-                error = error + output_deltas[k]*self.wo[j][k]
-            hidden_deltas[j] = dtanh(self.ah[j]) * error
+        hidden_deltas = dtanh(self.ah) * self.wo.dot(output_deltas)
 
         # update output weights
-        for j in range(len(self.hiddenids)):
-            for k in range(len(self.urlids)):
-                change = output_deltas[k]*self.ah[j]
-                self.wo[j][k] = self.wo[j][k] + N*change
+        self.wo += N*np.outer(self.ah,output_deltas)
 
         # update input weights
-        for i in range(len(self.wordids)):
-            for j in range(len(self.hiddenids)):
-                change = hidden_deltas[j]*self.ai[i]
-                self.wi[i][j] = self.wi[i][j] + N*change
+        self.wi += N*np.outer(self.ai,hidden_deltas)
 
     def trainquery(self,wordids,urlids,selectedurl): 
-      # generate a hidden node if necessary
-      self.generatehiddennode(wordids,urlids)
+      self.lock.acquire()
+      try:
+        # generate a hidden node if necessary
+        self.generatehiddennode(wordids,urlids)
+
+        self.setupnetwork(wordids,urlids)      
+        self.feedforward()
+        targets=[0.0]*len(urlids)
+        targets[urlids.index(selectedurl)]=1.0
+        error = self.backPropagate(targets)
+        self.updatedatabase()
+      finally:
+        self.lock.release()
 
-      self.setupnetwork(wordids,urlids)      
-      self.feedforward()
-      targets=[0.0]*len(urlids)
-      targets[urlids.index(selectedurl)]=1.0
-      error = self.backPropagate(targets)
-      self.updatedatabase()
+    # Adds {(layer,fromid,toid):change} to the weights and writes them
+    # all in one transaction
+    def addweights(self,changes):
+      self.lock.acquire()
+      try:
+        layers=self.getlayers()
+        for (layer,fromid,toid),change in changes.items():
+          layers[layer].add(fromid,toid,change)
+        self.updates+=1
+        self.flush()
+      finally:
+        self.lock.release()
 
     def updatedatabase(self):
-      # set them to database values
-      for i in range(len(self.wordids)):
-          for j in range(len(self.hiddenids)):
-              self.setstrength(self.wordids[i],self. hiddenids[j],0,self.wi[i][j])
-      for j in range(len(self.hiddenids)):
-          for k in range(len(self.urlids)):
-              self.setstrength(self.hiddenids[j],self.urlids[k],1,self.wo[j][k])
-      self.con.commit()
+      self.lock.acquire()
+      try:
+        # set them to database values
+        layers=self.getlayers()
+        layers[0].setsubmatrix(self.wordids,self.hiddenids,self.wi)
+        layers[1].setsubmatrix(self.hiddenids,self.urlids,self.wo)
+        self.updates+=1
+        self.pending+=1
+        if self.pending>=self.flushevery: self.flush()
+      finally:
+        self.lock.release()
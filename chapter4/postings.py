@@ -0,0 +1,120 @@
+# Compressed positional postings for the search index.
+#
+# Each word gets one posting list, stored as a single blob. The list
+# holds every page the word appears on, in urlid order, and for each
+# page the locations of the word on it:
+#
+#   urlid delta, number of locations, location deltas...
+#
+# Every number is written as a variable-length integer (7 bits per
+# byte, high bit set on all but the last byte), so the small deltas
+# of a sorted list take a byte or two each.
+
+def putvarint(out,n):
+  while n>=0x80:
+    out.append((n&0x7f)|0x80)
+    n>>=7
+  out.append(n)
+
+def encodepostings(postings):
+  # postings is a list of (urlid,locations) sorted by urlid,
+  # each list of locations sorted too
+  out=bytearray()
+  lasturl=0
+  for urlid,locations in postings:
+    putvarint(out,urlid-lasturl)
+    lasturl=urlid
+    putvarint(out,len(locations))
+    lastloc=0
+    for loc in locations:
+      putvarint(out,loc-lastloc)
+      lastloc=loc
+  return str(out)
+
+def getvarint(data,pos):
+  # Returns the number starting at pos and the position after it
+  n=0
+  shift=0
+  while 1:
+    b=data[pos]
+    pos+=1
+    n|=(b&0x7f)<<shift
+    if b<0x80: return n,pos
+    shift+=7
+
+def decodepostings(data,keep=None):
+  # Returns a dictionary of urlid:[locations]. If keep is given,
+  # only the pages in it are returned, the rest are skipped over
+  # without building their location lists
+  data=bytearray(data)
+  result={}
+  pos=0
+  urlid=0
+  while pos<len(data):
+    delta,pos=getvarint(data,pos)
+    urlid+=delta
+    count,pos=getvarint(data,pos)
+    if keep is not None and urlid not in keep:
+      # Skip over the locations of this page
+      while count>0:
+        if data[pos]<0x80: count-=1
+        pos+=1
+      continue
+    locations=[]
+    loc=0
+    for i in range(count):
+      delta,pos=getvarint(data,pos)
+      loc+=delta
+      locations.append(loc)
+    result[urlid]=locations
+  return result
+
+def intersect(lists):
+  # lists is a list of (ndocs,data) in query order. Decodes the
+  # shortest list first and only keeps pages that are in all of
+  # them. Returns a dictionary of urlid:[locations for each list]
+  if len(lists)==0: return {}
+  order=sorted(range(len(lists)),key=lambda i:lists[i][0])
+  decoded=[None]*len(lists)
+  keep=None
+  for i in order:
+    decoded[i]=decodepostings(lists[i][1],keep)
+    keep=decoded[i]
+    if len(keep)==0: return {}
+
+  # Later lists may have dropped pages still in earlier ones
+  return dict([(u,[d[u] for d in decoded]) for u in keep])
+
+def mindistance(loclists):
+  # The smallest total gap between consecutive query words, taking
+  # one location from each list. A sweep over the sorted lists does
+  # this in linear time instead of trying every combination.
+  prev=loclists[0]
+  best=[0]*len(prev)
+  for locations in loclists[1:]:
+    new=[1000000]*len(locations)
+
+    # Closest previous word at or before each location
+    i=0
+    low=None
+    for j in range(len(locations)):
+      l=locations[j]
+      while i<len(prev) and prev[i]<=l:
+        v=best[i]-prev[i]
+        if low==None or v<low: low=v
+        i+=1
+      if low!=None: new[j]=low+l
+
+    # Closest previous word at or after each location
+    i=len(prev)-1
+    low=None
+    for j in range(len(locations)-1,-1,-1):
+      l=locations[j]
+      while i>=0 and prev[i]>=l:
+        v=best[i]+prev[i]
+        if low==None or v<low: low=v
+        i-=1
+      if low!=None and low-l<new[j]: new[j]=low-l
+
+    prev,best=locations,new
+  return min(best)
@@ -2,20 +2,41 @@ import urllib2
 from BeautifulSoup import *
 from urlparse import urljoin
 from pysqlite2 import dbapi2 as sqlite
+from itertools import groupby,imap
+from multiprocessing import Pool
+from collections import OrderedDict
+import heapq
+import numpy as np
 import nn
+import postings
+import storage
+import textextract
 mynet=nn.searchnet('nn.db')
 
 # Create a list of words to ignore
 ignorewords={'the':1,'of':1,'to':1,'and':1,'a':1,'in':1,'is':1,'it':1}
 
 
+def hasoldindex(con):
+  tables=[row[0] for row in con.execute("select name from sqlite_master where type='table'")]
+  return 'wordlocation' in tables and 'postings' not in tables
+
 class crawler:
-  # Initialize the crawler with the name of database
+  # Initialize the crawler with the name of database, or a store
   def __init__(self,dbname):
-    self.con=sqlite.connect(dbname)
+    self.store=storage.getstore(dbname)
+    self.con=self.store.getconnection()
+    self.migrate()
   
   def __del__(self):
-    self.con.close()
+    self.store.putconnection(self.con)
+
+  # Indexes made before there were posting lists only have the
+  # wordlocation table, so build the lists from it
+  def migrate(self):
+    if not hasoldindex(self.con): return
+    self.con.execute('create table postings(wordid integer primary key,ndocs integer,data blob)')
+    self.buildpostings()
 
   def dbcommit(self):
     self.con.commit()
@@ -36,13 +57,15 @@ class crawler:
 
   # Index an individual page
   def addtoindex(self,url,soup):
-    if self.isindexed(url): return
-    print 'Indexing '+url
-  
     # Get the individual words
     text=self.gettextonly(soup)
-    words=self.separatewords(text)
-    
+    self.addwords(url,self.separatewords(text))
+
+  # Index the words of a page that has already been parsed
+  def addwords(self,url,words):
+    if self.isindexed(url): return
+    print 'Indexing '+url
+
     # Get the URL id
     urlid=self.getentryid('urllist','url',url)
     
@@ -58,20 +81,15 @@ class crawler:
   # Extract the text from an HTML page (no tags)
   def gettextonly(self,soup):
     v=soup.string
-    if v==Null:   
+    if v==None:
       c=soup.contents
-      resulttext=''
-      for t in c:
-        subtext=self.gettextonly(t)
-        resulttext+=subtext+'\n'
-      return resulttext
+      return ''.join([self.gettextonly(t)+'\n' for t in c])
     else:
       return v.strip()
 
   # Seperate the words by any non-whitespace character
   def separatewords(self,text):
-    splitter=re.compile('\\W*')
-    return [s.lower() for s in splitter.split(text) if s!='']
+    return textextract.separatewords(text)
 
     
   # Return true if this url is already indexed
@@ -80,7 +98,7 @@ class crawler:
   
   # Add a link between two pages
   def addlinkref(self,urlFrom,urlTo,linkText):
-    words=self.separateWords(linkText)
+    words=self.separatewords(linkText)
     fromid=self.getentryid('urllist','url',urlFrom)
     toid=self.getentryid('urllist','url',urlTo)
     if fromid==toid: return
@@ -91,38 +109,49 @@ class crawler:
       wordid=self.getentryid('wordlist','word',word)
       self.con.execute("insert into linkwords(linkid,wordid) values (%d,%d)" % (linkid,wordid))
 
+  # Download pages, yielding (url,html) for the ones that open
+  def fetchpages(self,pages):
+    for page in pages:
+      try:
+        c=urllib2.urlopen(page)
+        yield page,c.read()
+      except:
+        print "Could not open %s" % page
+
   # Starting with a list of pages, do a breadth
   # first search to the given depth, indexing pages
-  # as we go
-  def crawl(self,pages,depth=2):
-    for i in range(depth):
-      newpages={}
-      for page in pages:
-        try:
-          c=urllib2.urlopen(page)
-        except:
-          print "Could not open %s" % page
-          continue
-        try:
-          soup=BeautifulSoup(c.read())
-          self.addtoindex(page,soup)
-  
-          links=soup('a')
-          for link in links:
-            if ('href' in dict(link.attrs)):
-              url=urljoin(page,link['href'])
-              if url.find("'")!=-1: continue
-              url=url.split('#')[0]  # remove location portion
-              if url[0:4]=='http' and not self.isindexed(url):
-                newpages[url]=1
-              linkText=self.gettextonly(link)
-              self.addlinkref(page,url,linkText)
-  
+  # as we go. Pages are parsed in a pool of processes
+  # while the next ones download.
+  def crawl(self,pages,depth=2,processes=None):
+    if processes==1: pool=None
+    else: pool=Pool(processes)
+    try:
+      for i in range(depth):
+        newpages={}
+        if pool==None:
+          records=imap(textextract.extract,self.fetchpages(pages))
+        else:
+          records=pool.imap_unordered(textextract.extract,self.fetchpages(pages))
+        for page,words,links in records:
+          if words==None:
+            print "Could not parse page %s" % page
+            continue
+          self.addwords(page,words)
+
+          for url,linkText in links:
+            if url.find("'")!=-1: continue
+            if url[0:4]=='http' and not self.isindexed(url):
+              newpages[url]=1
+            self.addlinkref(page,url,linkText)
+
           self.dbcommit()
-        except:
-          print "Could not parse page %s" % page
 
-      pages=newpages
+        pages=newpages
+    finally:
+      if pool!=None:
+        pool.close()
+        pool.join()
+    self.buildpostings()
 
   
   # Create the database tables
@@ -137,6 +166,20 @@ class crawler:
     self.con.execute('create index wordurlidx on wordlocation(wordid)')
     self.con.execute('create index urltoidx on link(toid)')
     self.con.execute('create index urlfromidx on link(fromid)')
+    self.con.execute('create table postings(wordid integer primary key,ndocs integer,data blob)')
+    self.dbcommit()
+
+  # Rebuild the compressed posting list of every word from the
+  # wordlocation table
+  def buildpostings(self):
+    self.con.execute('delete from postings')
+    cur=self.con.execute(
+    'select wordid,urlid,location from wordlocation order by wordid,urlid,location')
+    for wordid,wordrows in groupby(cur,lambda row:row[0]):
+      pages=[(urlid,[row[2] for row in pagerows])
+             for urlid,pagerows in groupby(wordrows,lambda row:row[1])]
+      self.con.execute('insert into postings(wordid,ndocs,data) values (?,?,?)',
+                       (wordid,len(pages),sqlite.Binary(postings.encodepostings(pages))))
     self.dbcommit()
 
   def calculatepagerank(self,iterations=20):
@@ -169,57 +212,166 @@ class crawler:
         'update pagerank set score=%f where urlid=%d' % (pr,urlid))
       self.dbcommit()
 
+# A dictionary that only keeps the most recently used entries
+class lrucache:
+  def __init__(self,size):
+    self.size=size
+    self.entries=OrderedDict()
+
+  def get(self,key,default=None):
+    if key not in self.entries: return default
+    value=self.entries.pop(key)
+    self.entries[key]=value
+    return value
+
+  def put(self,key,value):
+    if key in self.entries: del self.entries[key]
+    elif len(self.entries)>=self.size: self.entries.popitem(last=False)
+    self.entries[key]=value
+
+  def clear(self):
+    self.entries.clear()
+
+# The link based scores of every page, held in arrays indexed by urlid
+# so a query can look up all of its pages at once
+class linksignals:
+  def __init__(self,con):
+    size=con.execute('select max(rowid) from urllist').fetchone()[0] or 0
+    size+=1
+
+    self.pagerank=np.zeros(size)
+    cur=con.execute('select urlid,score from pagerank')
+    rows=np.array(cur.fetchall(),dtype=float).reshape(-1,2)
+    self.pagerank[rows[:,0].astype(int)]=rows[:,1]
+
+    cur=con.execute('select toid from link')
+    toids=np.array([row[0] for row in cur],dtype=int)
+    self.inbound=np.bincount(toids,minlength=size)
+
+    # Sum of the page rank of the pages linking to each target for
+    # each word in the link text, sorted by word then target so one
+    # search finds the score for any (word,target) pair
+    cur=con.execute('select linkwords.wordid,link.toid,link.fromid '
+                    'from linkwords,link where linkwords.linkid=link.rowid')
+    rows=np.array(cur.fetchall(),dtype=int).reshape(-1,3)
+    keys=rows[:,0]*size+rows[:,1]
+    self.linkkeys,inverse=np.unique(keys,return_inverse=True)
+    self.linkscores=np.bincount(inverse,weights=self.pagerank[rows[:,2]],
+                                minlength=len(self.linkkeys))
+    self.size=size
+
+  def linktext(self,urlids,wordids):
+    scores=np.zeros(len(urlids))
+    if len(self.linkkeys)==0: return scores
+    for wordid in wordids:
+      keys=wordid*self.size+urlids
+      pos=np.searchsorted(self.linkkeys,keys)
+      pos[pos==len(self.linkkeys)]=0
+      found=self.linkkeys[pos]==keys
+      scores[found]+=self.linkscores[pos[found]]
+    return scores
+
+# All SQL run by the searcher uses ? parameters, so each statement is
+# compiled once and then reused from the connection's statement cache
 class searcher:
-  def __init__(self,dbname):
-    self.con=sqlite.connect(dbname)
+  # Searchers only read, so they get read-only connections
+  def __init__(self,dbname,wordcachesize=10000,querycachesize=1000):
+    self.store=storage.getstore(dbname)
+    self.con=self.store.getconnection(readonly=True)
+    # Searchers can't write, so a crawler brings an old index up to date
+    if hasoldindex(self.con): crawler(self.store).migrate()
+    self.signals=None
+    self.signalsversion=None
+    self.wordcache=lrucache(wordcachesize)
+    self.querycache=lrucache(querycachesize)
+    self.cacheversion=None
 
   def __del__(self):
-    self.con.close()
-
+    self.store.putconnection(self.con,readonly=True)
+
+  # Changes whenever the index does. data_version moves when another
+  # connection commits, total_changes when a store shares this
+  # connection with a writer.
+  def indexversion(self):
+    return (self.con.execute('pragma data_version').fetchone()[0],
+            self.con.total_changes)
+
+  # Load the link based scores the first time they are needed, and
+  # again after the index has changed
+  def getsignals(self):
+    version=self.indexversion()
+    if self.signals==None or version!=self.signalsversion:
+      self.signals=linksignals(self.con)
+      self.signalsversion=version
+    return self.signals
+
+  # Words are stored in lower case, and extra spaces don't matter
+  def normalizequery(self,q):
+    return ' '.join(q.lower().split())
+
+  # Returns the id of a word, or None if it isn't in the index
+  def getwordid(self,word):
+    wordid=self.wordcache.get(word)
+    if wordid==None:
+      wordrow=self.con.execute(
+      'select rowid from wordlist where word=?',(word,)).fetchone()
+      if wordrow==None: return None
+      wordid=wordrow[0]
+      self.wordcache.put(word,wordid)
+    return wordid
+
+  # Returns a dictionary of urlid:[locations of each query word]
+  # for every page that has all the words, along with the word ids
   def getmatchrows(self,q):
-    # Strings to build the query
-    fieldlist='w0.urlid'
-    tablelist=''  
-    clauselist=''
+    lists=[]
     wordids=[]
 
     # Split the words by spaces
-    words=q.split(' ')  
-    tablenumber=0
+    words=self.normalizequery(q).split(' ')
 
     for word in words:
       # Get the word ID
-      wordrow=self.con.execute(
-      "select rowid from wordlist where word='%s'" % word).fetchone()
-      if wordrow!=None:
-        wordid=wordrow[0]
+      wordid=self.getwordid(word)
+      if wordid!=None:
         wordids.append(wordid)
-        if tablenumber>0:
-          tablelist+=','
-          clauselist+=' and '
-          clauselist+='w%d.urlid=w%d.urlid and ' % (tablenumber-1,tablenumber)
-        fieldlist+=',w%d.location' % tablenumber
-        tablelist+='wordlocation w%d' % tablenumber      
-        clauselist+='w%d.wordid=%d' % (tablenumber,wordid)
-        tablenumber+=1
-
-    # Create the query from the separate parts
-    fullquery='select %s from %s where %s' % (fieldlist,tablelist,clauselist)
-    print fullquery
-    cur=self.con.execute(fullquery)
-    rows=[row for row in cur]
-
-    return rows,wordids
-
-  def getscoredlist(self,rows,wordids):
-    totalscores=dict([(row[0],0) for row in rows])
+        postingrow=self.con.execute(
+        'select ndocs,data from postings where wordid=?',(wordid,)).fetchone()
+        if postingrow==None: return {},wordids
+        lists.append(postingrow)
+
+    return postings.intersect(lists),wordids
+
+  # The neural network's score counts for this many of the others
+  nnweight=5.0
+
+  # Every score but the network's, with its weight, as arrays lined up
+  # with urlids. These are cheap to work out for every page. They are
+  # the same as locationscore, frequencyscore, pagerankscore and
+  # linktextscore, with one pass over the locations for the first two.
+  def basescores(self,urlids,matches,wordids):
+    locations=np.empty(len(urlids))
+    counts=np.empty(len(urlids))
+    for i in range(len(urlids)):
+      loclists=matches[urlids[i]]
+      locations[i]=sum([l[0] for l in loclists])
+      c=1
+      for l in loclists: c*=len(l)
+      counts[i]=c
+    signals=self.getsignals()
+    ids=np.array(urlids,dtype=int)
+    return [(1.0,self.normalized(locations,smallIsBetter=1)),
+            (1.0,self.normalized(counts)),
+            (1.0,self.normalized(signals.pagerank[ids])),
+            (1.0,self.normalized(signals.linktext(ids,wordids)))]
+
+  def getscoredlist(self,matches,wordids):
+    totalscores=dict([(u,0) for u in matches])
 
     # This is where we'll put our scoring functions
-    weights=[(1.0,self.locationscore(rows)), 
-             (1.0,self.frequencyscore(rows)),
-             (1.0,self.pagerankscore(rows)),
-             (1.0,self.linktextscore(rows,wordids)),
-             (5.0,self.nnscore(rows,wordids))]
+    urlids=matches.keys()
+    weights=[(weight,dict(zip(urlids,scores.tolist())))
+             for (weight,scores) in self.basescores(urlids,matches,wordids)]
+    weights.append((self.nnweight,self.nnscore(matches,wordids)))
     for (weight,scores) in weights:
       for url in totalscores:
         totalscores[url]+=weight*scores[url]
@@ -228,17 +380,132 @@ class searcher:
 
   def geturlname(self,id):
     return self.con.execute(
-    "select url from urllist where rowid=%d" % id).fetchone()[0]
-
-  def query(self,q):
-    rows,wordids=self.getmatchrows(q)
-    scores=self.getscoredlist(rows,wordids)
-    rankedscores=[(score,url) for (url,score) in scores.items()]
-    rankedscores.sort()
-    rankedscores.reverse()
-    for (score,urlid) in rankedscores[0:10]:
-      print '%f\t%s' % (score,self.geturlname(urlid))
-    return wordids,[r[1] for r in rankedscores[0:10]]
+    'select url from urllist where rowid=?',(id,)).fetchone()[0]
+
+  # Returns a dictionary of urlid:url, with one query for all of them
+  def geturlnames(self,ids):
+    if len(ids)==0: return {}
+    cur=self.con.execute('select rowid,url from urllist where rowid in (%s)' %
+                         ','.join(['?']*len(ids)),list(ids))
+    return dict([(id,url) for (id,url) in cur])
+
+  # Returns the n best (score,urlid) pairs, the same as sorting the
+  # output of getscoredlist, running as few pages as it can through
+  # the neural network, the most expensive score and the heaviest.
+  #
+  # The network's outputs are divided by the largest of them, so that
+  # has to be known first. mynet.getoutputbounds gives a cheap bound on
+  # each page's output, and pages are run through the network, largest
+  # bound first, until no page left could have a larger output than
+  # the largest seen. After that each page's total is bounded by its
+  # other scores plus the most its output could add, and pages are run
+  # best bound first until no page left could beat the n-th best.
+  # scored is set to how many pages went through the network.
+  def gettopk(self,matches,wordids,n=10,batchsize=None):
+    vsmall=0.00001
+    self.scored=0
+    if len(matches)==0: return []
+    if batchsize==None: batchsize=n
+
+    urlids=matches.keys()
+    ids=np.array(urlids,dtype=int)
+    scores=np.zeros(len(urlids))
+    for (weight,s) in self.basescores(urlids,matches,wordids):
+      scores+=weight*s
+
+    # Pages no hidden node connects to always come out as 0, so their
+    # totals are their other scores, and only the n best of them (and
+    # any tied with the n-th) could make the top n
+    isconnected=np.in1d(ids,mynet.getconnectedurls(urlids))
+    others=np.flatnonzero(~isconnected)
+    maxoutput=None
+    if len(others)>0: maxoutput=0.0
+    if len(others)>n:
+      nth=np.partition(scores[others],len(others)-n)[len(others)-n]
+      others=others[scores[others]>=nth]
+    heap=heapq.nlargest(n,zip(scores[others].tolist(),ids[others].tolist()))
+    heapq.heapify(heap)
+
+    connected=ids[isconnected].tolist()
+    base=dict(zip(connected,scores[isconnected].tolist()))
+    outputs={}
+    bounds=dict(zip(connected,mynet.getoutputbounds(wordids,connected)))
+
+    def run(batch):
+      self.scored+=len(batch)
+      results=mynet.getresult(wordids,batch)
+      for i in range(len(batch)): outputs[batch[i]]=results[i]
+      return results
+
+    # Find the largest output
+    left=sorted(connected,key=lambda u:-bounds[u])
+    while len(left)>0 and (maxoutput==None or bounds[left[0]]>maxoutput):
+      results=run(left[0:batchsize])
+      left=left[batchsize:]
+      if maxoutput!=None: results.append(maxoutput)
+      maxoutput=max(results)
+
+    # Normalized like normalizescores
+    maxscore=maxoutput
+    if maxscore==0: maxscore=vsmall
+    def total(u):
+      return base[u]+self.nnweight*(float(outputs[u])/maxscore)
+    def upperbound(u):
+      high=min(bounds[u],maxoutput)
+      low=-bounds[u]
+      return base[u]+self.nnweight*max(high/maxscore,low/maxscore)
+    def push(u):
+      if len(heap)<n: heapq.heappush(heap,(total(u),u))
+      elif (total(u),u)>heap[0]: heapq.heapreplace(heap,(total(u),u))
+
+    for u in outputs: push(u)
+    left.sort(key=lambda u:-upperbound(u))
+    for start in range(0,len(left),batchsize):
+      if len(heap)==n and upperbound(left[start])<heap[0][0]: break
+      batch=left[start:start+batchsize]
+      run(batch)
+      for u in batch: push(u)
+
+    return heapq.nlargest(n,heap)
+
+  # Results are cached by the normalized query. A change to the index
+  # or to the network weights makes every cached result stale.
+  def query(self,q,n=10,show=True):
+    version=(self.indexversion(),mynet.getversion())
+    if version!=self.cacheversion:
+      self.wordcache.clear()
+      self.querycache.clear()
+      self.cacheversion=version
+    key=(self.normalizequery(q),n,version)
+
+    result=self.querycache.get(key)
+    if result==None:
+      matches,wordids=self.getmatchrows(q)
+      rankedscores=self.gettopk(matches,wordids,n)
+      urlnames=self.geturlnames([urlid for (score,urlid) in rankedscores])
+      result=(wordids,rankedscores,urlnames)
+      self.querycache.put(key,result)
+
+    wordids,rankedscores,urlnames=result
+    if show:
+      for (score,urlid) in rankedscores:
+        print '%f\t%s' % (score,urlnames[urlid])
+    return wordids,[r[1] for r in rankedscores]
+
+  # Like normalizescores, for an array of scores
+  def normalized(self,scores,smallIsBetter=0):
+    vsmall=0.00001 # Avoid division by zero errors
+    scores=np.asarray(scores,dtype=float)
+    if smallIsBetter:
+      return scores.min()/np.maximum(vsmall,scores)
+    else:
+      maxscore=scores.max()
+      if maxscore==0: maxscore=vsmall
+      return scores/maxscore
+
+  # Like normalizescores, for an array of scores lined up with urlids
+  def normalizearray(self,urlids,scores,smallIsBetter=0):
+    return dict(zip(urlids.tolist(),self.normalized(scores,smallIsBetter).tolist()))
 
   def normalizescores(self,scores,smallIsBetter=0):
     vsmall=0.00001 # Avoid division by zero errors
@@ -250,57 +517,49 @@ class searcher:
       if maxscore==0: maxscore=vsmall
       return dict([(u,float(c)/maxscore) for (u,c) in scores.items()])
 
-  def frequencyscore(self,rows):
-    counts=dict([(row[0],0) for row in rows])
-    for row in rows: counts[row[0]]+=1
+  def frequencyscore(self,matches):
+    # The number of combinations of word locations on each page
+    counts={}
+    for u,loclists in matches.items():
+      c=1
+      for locations in loclists: c*=len(locations)
+      counts[u]=c
     return self.normalizescores(counts)
 
-  def locationscore(self,rows):
-    locations=dict([(row[0],1000000) for row in rows])
-    for row in rows:
-      loc=sum(row[1:])
-      if loc<locations[row[0]]: locations[row[0]]=loc
-    
+  def locationscore(self,matches):
+    # Locations are sorted, so the first one of each word is the earliest
+    locations=dict([(u,sum([l[0] for l in loclists]))
+                    for (u,loclists) in matches.items()])
     return self.normalizescores(locations,smallIsBetter=1)
 
-  def distancescore(self,rows):
+  def distancescore(self,matches):
     # If there's only one word, everyone wins!
-    if len(rows[0])<=2: return dict([(row[0],1.0) for row in rows])
+    if len(matches.values()[0])<=1: return dict([(u,1.0) for u in matches])
 
-    # Initialize the dictionary with large values
-    mindistance=dict([(row[0],1000000) for row in rows])
-
-    for row in rows:
-      dist=sum([abs(row[i]-row[i-1]) for i in range(2,len(row))])
-      if dist<mindistance[row[0]]: mindistance[row[0]]=dist
+    mindistance=dict([(u,postings.mindistance(loclists))
+                      for (u,loclists) in matches.items()])
     return self.normalizescores(mindistance,smallIsBetter=1)
 
-  def inboundlinkscore(self,rows):
-    uniqueurls=dict([(row[0],1) for row in rows])
-    inboundcount=dict([(u,self.con.execute('select count(*) from link where toid=%d' % u).fetchone()[0]) for u in uniqueurls])   
-    return self.normalizescores(inboundcount)
+  def inboundlinkscore(self,matches):
+    urlids=np.array(matches.keys(),dtype=int)
+    return self.normalizearray(urlids,self.getsignals().inbound[urlids])
 
-  def linktextscore(self,rows,wordids):
-    linkscores=dict([(row[0],0) for row in rows])
-    for wordid in wordids:
-      cur=self.con.execute('select link.fromid,link.toid from linkwords,link where wordid=%d and linkwords.linkid=link.rowid' % wordid)
-      for (fromid,toid) in cur:
-        if toid in linkscores:
-          pr=self.con.execute('select score from pagerank where urlid=%d' % fromid).fetchone()[0]
-          linkscores[toid]+=pr
-    maxscore=max(linkscores.values())
-    normalizedscores=dict([(u,float(l)/maxscore) for (u,l) in linkscores.items()])
-    return normalizedscores
-
-  def pagerankscore(self,rows):
-    pageranks=dict([(row[0],self.con.execute('select score from pagerank where urlid=%d' % row[0]).fetchone()[0]) for row in rows])
-    maxrank=max(pageranks.values())
-    normalizedscores=dict([(u,float(l)/maxrank) for (u,l) in pageranks.items()])
-    return normalizedscores
-
-  def nnscore(self,rows,wordids):
+  def linktextscore(self,matches,wordids):
+    urlids=np.array(matches.keys(),dtype=int)
+    return self.normalizearray(urlids,self.getsignals().linktext(urlids,wordids))
+
+  def pagerankscore(self,matches):
+    urlids=np.array(matches.keys(),dtype=int)
+    return self.normalizearray(urlids,self.getsignals().pagerank[urlids])
+
+  def nnscore(self,matches,wordids):
     # Get unique URL IDs as an ordered list
-    urlids=[urlid for urlid in dict([(row[0],1) for row in rows])]
-    nnres=mynet.getresult(wordids,urlids)
-    scores=dict([(urlids[i],nnres[i]) for i in range(len(urlids))])
+    urlids=matches.keys()
+    # Pages no hidden node connects to always come out as 0, so only the
+    # rest go through the network, all in one pass
+    scores=dict([(u,0.0) for u in urlids])
+    connected=mynet.getconnectedurls(urlids)
+    if len(connected)>0:
+      nnres=mynet.getresult(wordids,connected)
+      for i in range(len(connected)): scores[connected[i]]=nnres[i]
     return self.normalizescores(scores)
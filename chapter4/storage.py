@@ -0,0 +1,105 @@
+# Where the crawler, searcher and network keep their tables.
+#
+# A store hands out database connections and takes them back when
+# they are done with. Everything else talks to the connections with
+# plain SQL, so switching stores doesn't change any of the queries.
+#
+# sqlitestore is a database file tuned for one crawler writing while
+# any number of searchers read. memorystore keeps everything in memory
+# for benchmarks and tests.
+
+import os
+import threading
+from pysqlite2 import dbapi2 as sqlite
+
+class sqlitestore:
+  # cachesize is in KB, mmapsize in bytes. pagesize only has an effect
+  # when the database file is first created.
+  def __init__(self,dbname,cachesize=65536,pagesize=4096,
+               mmapsize=256*1024*1024,poolsize=8):
+    self.dbname=dbname
+    self.cachesize=cachesize
+    self.pagesize=pagesize
+    self.mmapsize=mmapsize
+    self.poolsize=poolsize
+    self.pool={True:[],False:[]}
+    self.lock=threading.Lock()
+
+  def connect(self,readonly=False):
+    con=sqlite.connect(self.dbname,check_same_thread=False)
+    con.execute('pragma cache_size=-%d' % self.cachesize)
+    con.execute('pragma mmap_size=%d' % self.mmapsize)
+    con.execute('pragma temp_store=memory')
+    if readonly:
+      con.execute('pragma query_only=1')
+    else:
+      # With write-ahead logging readers don't block the writer and
+      # the writer doesn't block readers. NORMAL sync is still safe
+      # against corruption in that mode.
+      con.execute('pragma page_size=%d' % self.pagesize)
+      con.execute('pragma journal_mode=wal')
+      con.execute('pragma synchronous=normal')
+    return con
+
+  # Reuse a pooled connection if there is one
+  def getconnection(self,readonly=False):
+    self.lock.acquire()
+    try:
+      if len(self.pool[readonly])>0: return self.pool[readonly].pop()
+    finally:
+      self.lock.release()
+    return self.connect(readonly)
+
+  def putconnection(self,con,readonly=False):
+    con.rollback()
+    self.lock.acquire()
+    try:
+      if len(self.pool[readonly])<self.poolsize:
+        self.pool[readonly].append(con)
+        return
+    finally:
+      self.lock.release()
+    con.close()
+
+  def close(self):
+    self.lock.acquire()
+    try:
+      for con in self.pool[True]+self.pool[False]: con.close()
+      self.pool={True:[],False:[]}
+    finally:
+      self.lock.release()
+
+class memorystore:
+  # An in-memory database only exists for the connection that made it,
+  # so every user of the store shares one connection
+  def __init__(self):
+    self.con=sqlite.connect(':memory:',check_same_thread=False)
+    self.dbname=':memory:'
+
+  def connect(self,readonly=False):
+    return self.con
+
+  def getconnection(self,readonly=False):
+    return self.con
+
+  def putconnection(self,con,readonly=False):
+    pass
+
+  def close(self):
+    pass
+
+# One sqlitestore per database file, so the crawler, searchers and
+# network using the same file share its connection pool
+stores={}
+storelock=threading.Lock()
+
+# Accepts either a store or the name of a database file
+def getstore(db):
+  if not isinstance(db,basestring): return db
+  path=os.path.abspath(db)
+  storelock.acquire()
+  try:
+    if path not in stores: stores[path]=sqlitestore(path)
+    return stores[path]
+  finally:
+    storelock.release()
@@ -0,0 +1,62 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import clicktrainer
+import nn
+import storage
+
+class trainclicklogtest(unittest.TestCase):
+  def setUp(self):
+    self.dir=tempfile.mkdtemp()
+    self.filename=os.path.join(self.dir,'clicks')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def newnet(self):
+    net=nn.searchnet(storage.memorystore())
+    net.maketables()
+    return net
+
+  # Clicks on overlapping results for the same words, in the order
+  # trainclicklog trains their groups
+  def makelog(self):
+    random.seed(0)
+    clicks=[]
+    for i in range(10):
+      urlids=sorted(random.sample(range(1,15),4))
+      clicks+=[([1,2],urlids,random.choice(urlids[0:2])) for j in range(random.randint(1,20))]
+    groups=clicktrainer.groupclicks(clicks)
+    clicks=[(list(w),list(u),selected) for (w,u) in sorted(groups.keys())
+            for selected in groups[(w,u)]]
+    clicktrainer.writeclicklog(self.filename,clicks)
+    return clicks
+
+  # Groups that share weights are trained one after another, so with
+  # batches of one click they come out as trainquery leaves them
+  def testsequential(self):
+    clicks=self.makelog()
+    net=self.newnet()
+    clicktrainer.trainclicklog(net,self.filename,batchsize=1,processes=1)
+    expected=self.newnet()
+    for wordids,urlids,selectedurl in clicks:
+      expected.trainquery(wordids,urlids,selectedurl)
+    urlids=range(1,15)
+    for a,b in zip(net.getresult([1,2],urlids),expected.getresult([1,2],urlids)):
+      self.assertAlmostEqual(a,b)
+
+  def testpool(self):
+    self.makelog()
+    net=self.newnet()
+    clicktrainer.trainclicklog(net,self.filename,processes=1)
+    pooled=self.newnet()
+    clicktrainer.trainclicklog(pooled,self.filename,processes=2)
+    urlids=range(1,15)
+    for a,b in zip(net.getresult([1,2],urlids),pooled.getresult([1,2],urlids)):
+      self.assertAlmostEqual(a,b)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+import os
+import random
+import shutil
+import threading
+import tempfile
+import unittest
+from pysqlite2 import dbapi2 as sqlite
+
+import nn
+import storage
+
+class migratetest(unittest.TestCase):
+  def setUp(self):
+    self.dir=tempfile.mkdtemp()
+    self.dbname=os.path.join(self.dir,'nn.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  # The tables as the book's maketables made them, with a weight that
+  # was written twice
+  def makeoldtables(self):
+    con=sqlite.connect(self.dbname)
+    con.execute('create table hiddennode(create_key)')
+    con.execute('create table wordhidden(fromid,toid,strength)')
+    con.execute('create table hiddenurl(fromid,toid,strength)')
+    con.execute("insert into hiddennode(create_key) values ('1_2')")
+    con.executemany('insert into wordhidden values (?,?,?)',[(1,1,0.5),(2,1,0.5)])
+    con.executemany('insert into hiddenurl values (?,?,?)',
+                    [(1,10,0.1),(1,11,0.1),(1,10,0.3)])
+    con.commit()
+    con.close()
+
+  def testoldtables(self):
+    self.makeoldtables()
+    net=nn.searchnet(self.dbname)
+    # The latest of the duplicates is kept
+    self.assertEqual(net.getstrength(1,10,1),0.3)
+    net.trainquery([1,2],[10,11],11)
+    net.trainquery([1,2,3],[10,11,12],10)
+    count=net.con.execute('select count(*) from hiddenurl where fromid=1 and toid=10').fetchone()[0]
+    self.assertEqual(count,1)
+    self.assertEqual(net.con.execute('select count(*) from hiddennode').fetchone()[0],2)
+    self.assertEqual(net.con.execute('select count(*) from hiddenurl where updated is null').fetchone()[0],0)
+
+    # Opening it again leaves it as it is
+    weights=net.con.execute('select * from hiddenurl order by fromid,toid').fetchall()
+    again=nn.searchnet(self.dbname)
+    self.assertEqual(again.con.execute('select * from hiddenurl order by fromid,toid').fetchall(),weights)
+
+  def testnewtables(self):
+    net=nn.searchnet(self.dbname)
+    net.maketables()
+    net.trainquery([1,2],[10,11],11)
+    self.assertEqual(nn.searchnet(self.dbname).getstrength(1,10,1),net.getstrength(1,10,1))
+
+class boundstest(unittest.TestCase):
+  # getoutputbounds is never below the size of an output, for pages
+  # some query word connects to and pages none does
+  def testbounds(self):
+    random.seed(0)
+    net=nn.searchnet(storage.memorystore())
+    net.maketables()
+    for i in range(100):
+      wordids=random.sample(range(1,20),random.randint(1,3))
+      urlids=random.sample(range(1,100),random.randint(1,30))
+      net.trainquery(wordids,urlids,random.choice(urlids))
+    for i in range(100):
+      wordids=random.sample(range(1,25),random.randint(1,3))
+      urlids=net.getconnectedurls(range(1,100))
+      for bound,output in zip(net.getoutputbounds(wordids,urlids),
+                              net.getresult(wordids,urlids)):
+        self.assertTrue(bound>=abs(output))
+
+class threadtest(unittest.TestCase):
+  # Threads sharing one network get the same outputs as running the
+  # queries one at a time, while another thread trains it
+  def testsharednet(self):
+    random.seed(0)
+    net=nn.searchnet(storage.memorystore())
+    net.maketables()
+    queries=[]
+    for i in range(50):
+      wordids=random.sample(range(1,20),random.randint(1,3))
+      urlids=random.sample(range(1,100),random.randint(1,30))
+      net.trainquery(wordids,urlids,random.choice(urlids))
+      queries.append((wordids,urlids))
+    expected=[net.getresult(wordids,urlids) for (wordids,urlids) in queries]
+
+    errors=[]
+    def query():
+      try:
+        for i in range(20):
+          for (wordids,urlids),result in zip(queries,expected):
+            if net.getresult(wordids,urlids)!=result: errors.append('wrong result')
+      except Exception,e:
+        errors.append(e)
+    def train():
+      # Clicks on new words don't change any of the queries' outputs
+      for i in range(200):
+        urlids=random.sample(range(100,200),10)
+        net.trainquery([100+i],urlids,urlids[0])
+
+    threads=[threading.Thread(target=query) for i in range(4)]
+    threads.append(threading.Thread(target=train))
+    for t in threads: t.start()
+    for t in threads: t.join()
+    self.assertEqual(errors,[])
+
+if __name__=='__main__':
+  unittest.main()
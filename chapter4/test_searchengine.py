@@ -0,0 +1,163 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+import nn
+import storage
+
+# searchengine opens its network in nn.db in the current directory when
+# it is imported, so keep that out of the source tree
+here=os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+  import searchengine
+finally:
+  os.chdir(here)
+
+# A searcher whose scores, other than the network's, are set by hand
+class fixedsearcher(searchengine.searcher):
+  def __init__(self,base):
+    searchengine.searcher.__init__(self,storage.memorystore())
+    self.base=base
+
+  def basescores(self,urlids,matches,wordids):
+    return [(1.0,np.array([self.base[u] for u in urlids]))]
+
+# A network that gives fixed outputs for every page, bounded by
+# bounds (the outputs themselves by default), and keeps the pages it
+# was run on
+class fixednet:
+  def __init__(self,outputs,bounds=None):
+    self.outputs=outputs
+    if bounds==None: bounds=dict([(u,abs(o)) for (u,o) in outputs.items()])
+    self.bounds=bounds
+    self.run=[]
+
+  def getconnectedurls(self,urlids):
+    return [u for u in urlids if self.outputs[u]!=0]
+
+  def getoutputbounds(self,wordids,urlids):
+    return [self.bounds[u] for u in urlids]
+
+  def getresult(self,wordids,urlids):
+    self.run+=urlids
+    return [self.outputs[u] for u in urlids]
+
+class topktest(unittest.TestCase):
+  def setUp(self):
+    self.mynet=searchengine.mynet
+
+  def tearDown(self):
+    searchengine.mynet=self.mynet
+
+  # The n best of getscoredlist, ranked the way query ranks them
+  def fullranking(self,s,matches,wordids,n):
+    scores=s.getscoredlist(matches,wordids)
+    rankedscores=[(score,u) for (u,score) in scores.items()]
+    rankedscores.sort()
+    rankedscores.reverse()
+    return rankedscores[0:n]
+
+  def assertsameranking(self,topk,full):
+    self.assertEqual([u for (score,u) in topk],[u for (score,u) in full])
+    for (a,u),(b,v) in zip(topk,full): self.assertAlmostEqual(a,b)
+
+  # Network outputs have to be normalized by the largest output of any
+  # page, including the ones that can't make the top n
+  def testnormalizesoverallpages(self):
+    matches={1:[[0]],2:[[0]],3:[[0]]}
+    s=fixedsearcher({1:10.0,2:8.0,3:5.0})
+    for outputs in [{1:0.1,2:0.2,3:0.9},{1:-0.1,2:-0.2,3:-0.9},{1:0.0,2:-0.3,3:0.0}]:
+      searchengine.mynet=fixednet(outputs)
+      for n in [1,2,3]:
+        self.assertsameranking(s.gettopk(matches,[1],n),
+                               self.fullranking(s,matches,[1],n))
+
+  # Pages that can't make the top n aren't run through the network
+  def testskipspages(self):
+    matches=dict([(u,[[0]]) for u in range(1,51)])
+    s=fixedsearcher(dict([(u,100.0-u) for u in matches]))
+    outputs=dict([(u,0.05) for u in matches])
+    outputs[30]=0.9
+    searchengine.mynet=fixednet(outputs)
+    full=self.fullranking(s,matches,[1],3)
+    searchengine.mynet.run=[]
+    self.assertsameranking(s.gettopk(matches,[1],3),full)
+    # One batch of three to find the largest output, from 30, and one
+    # more after which no page left can beat the third best
+    self.assertEqual(sorted(searchengine.mynet.run),[1,2,3,4,5,30])
+    self.assertEqual(s.scored,6)
+
+    # With loose bounds every page has to be run to find the largest
+    searchengine.mynet=fixednet(outputs,dict([(u,1.0) for u in matches]))
+    self.assertsameranking(s.gettopk(matches,[1],3),full)
+    self.assertEqual(s.scored,50)
+
+  def testnomatches(self):
+    self.assertEqual(fixedsearcher({}).gettopk({},[1],10),[])
+
+  # The same pages in the same order as getscoredlist, with a trained
+  # network
+  def testmatchesscoredlist(self):
+    random.seed(0)
+    store=storage.memorystore()
+    crawler=searchengine.crawler(store)
+    crawler.createindextables()
+    words=['w%d' % i for i in range(30)]
+    urls=['http://test/%d' % i for i in range(60)]
+    for url in urls:
+      crawler.addwords(url,[random.choice(words[0:random.randint(1,30)])
+                            for i in range(40)])
+    for i in range(120):
+      crawler.addlinkref(random.choice(urls),random.choice(urls),random.choice(words))
+    crawler.dbcommit()
+    crawler.buildpostings()
+    crawler.calculatepagerank(5)
+
+    searchengine.mynet=nn.searchnet(storage.memorystore())
+    searchengine.mynet.maketables()
+    s=searchengine.searcher(store)
+    queries=words[0:10]+['%s %s' % (random.choice(words[0:5]),random.choice(words))
+                         for i in range(10)]
+    for i in range(100):
+      matches,wordids=s.getmatchrows(random.choice(queries))
+      if len(matches)==0: continue
+      urlids=random.sample(matches.keys(),min(8,len(matches)))
+      searchengine.mynet.trainquery(wordids,urlids,random.choice(urlids))
+
+    for q in queries:
+      matches,wordids=s.getmatchrows(q)
+      if len(matches)==0: continue
+      # The array scores are the scoring functions' own
+      urlids=matches.keys()
+      expected=[s.locationscore(matches),s.frequencyscore(matches),
+                s.pagerankscore(matches),s.linktextscore(matches,wordids)]
+      for (weight,scores),d in zip(s.basescores(urlids,matches,wordids),expected):
+        self.assertEqual(scores.tolist(),[d[u] for u in urlids])
+      for n in [1,3,10]:
+        self.assertsameranking(s.gettopk(matches,wordids,n),
+                               self.fullranking(s,matches,wordids,n))
+
+class migratetest(unittest.TestCase):
+  # An index crawled before there were posting lists gets them when a
+  # searcher first opens it
+  def testoldindex(self):
+    store=storage.memorystore()
+    crawler=searchengine.crawler(store)
+    crawler.createindextables()
+    crawler.addwords('http://test/1',['old','index'])
+    crawler.addwords('http://test/2',['old','words'])
+    crawler.con.execute('drop table postings')
+    crawler.dbcommit()
+
+    s=searchengine.searcher(store)
+    matches,wordids=s.getmatchrows('old index')
+    self.assertEqual(len(wordids),2)
+    self.assertEqual(matches.keys(),[1])
+    self.assertEqual(len(s.getmatchrows('old')[0]),2)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib
+
+import storage
+import textextract
+
+# searchengine opens its network in nn.db in the current directory when
+# it is imported, so keep that out of the source tree
+here=os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+  import searchengine
+finally:
+  os.chdir(here)
+
+badpage='''<html><body><p>Some words before
+<a href="http://[::1">a link urlparse can't read</a>
+and <a href="other.html#top">another link</a> after.</p></body></html>'''
+
+class extracttest(unittest.TestCase):
+  def testmalformedhref(self):
+    url,words,links=textextract.extract(('http://test/page.html',badpage))
+    self.assertEqual(url,'http://test/page.html')
+    self.assertTrue('before' in words and 'after' in words)
+    self.assertEqual(links,[('http://test/other.html','another link')])
+
+  def testbadpage(self):
+    # Anything that goes wrong on a page marks it as unparsed
+    self.assertEqual(textextract.extract(('http://test/',None)),
+                     ('http://test/',None,[]))
+
+class crawltest(unittest.TestCase):
+  def setUp(self):
+    self.dir=tempfile.mkdtemp()
+    self.pages=[]
+    for name,html in [('bad.html',badpage),('good.html','<p>plain page</p>')]:
+      path=os.path.join(self.dir,name)
+      out=open(path,'w')
+      out.write(html)
+      out.close()
+      self.pages.append('file://'+urllib.pathname2url(path))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def crawl(self,processes):
+    crawler=searchengine.crawler(storage.memorystore())
+    crawler.createindextables()
+    crawler.crawl(self.pages,depth=1,processes=processes)
+    # Both pages have their words indexed
+    for page in self.pages:
+      count=crawler.con.execute('select count(*) from wordlocation,urllist '
+                                'where urlid=urllist.rowid and url=?',(page,)).fetchone()[0]
+      self.assertTrue(count>0)
+
+  def testcrawl(self):
+    self.crawl(1)
+
+  def testcrawlpool(self):
+    self.crawl(2)
+
+if __name__=='__main__':
+  unittest.main()
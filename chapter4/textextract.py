@@ -0,0 +1,60 @@
+# Turns fetched HTML into what the crawler indexes.
+#
+# extract takes (url,html) and returns (url,words,links), where links
+# is a list of (absolute url,anchor text). It uses the standard
+# library's streaming HTMLParser rather than building a BeautifulSoup
+# tree, and has no state, so pages can be handed to a process pool.
+
+import re
+from HTMLParser import HTMLParser
+from urlparse import urljoin
+
+# Split on anything that isn't a letter, digit or underscore
+splitter=re.compile('\\W+')
+
+def separatewords(text):
+  return [s.lower() for s in splitter.split(text) if s!='']
+
+class pageparser(HTMLParser):
+  def __init__(self,url):
+    HTMLParser.__init__(self)
+    self.url=url
+    self.text=[]
+    self.links=[]
+    # The link being read, as [url,[pieces of anchor text]]
+    self.link=None
+    self.skip=0
+
+  def handle_starttag(self,tag,attrs):
+    if tag in ('script','style'): self.skip+=1
+    elif tag=='a':
+      href=dict(attrs).get('href')
+      if href!=None:
+        try:
+          url=urljoin(self.url,href).split('#')[0]  # remove location portion
+        except ValueError:
+          # Not a URL urlparse can read, like http://[::1
+          return
+        self.link=[url,[]]
+
+  def handle_endtag(self,tag):
+    if tag in ('script','style'): self.skip=max(0,self.skip-1)
+    elif tag=='a' and self.link!=None:
+      self.links.append((self.link[0],' '.join(self.link[1])))
+      self.link=None
+
+  def handle_data(self,data):
+    if self.skip: return
+    self.text.append(data)
+    if self.link!=None: self.link[1].append(data)
+
+def extract(page):
+  url,html=page
+  parser=pageparser(url)
+  try:
+    parser.feed(html)
+    parser.close()
+  except Exception:
+    # One bad page shouldn't stop a crawl
+    return url,None,[]
+  return url,separatewords('\n'.join(parser.text)),parser.links
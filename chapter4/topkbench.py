@@ -0,0 +1,132 @@
+# Query latency benchmark for searcher.gettopk on a synthetic index.
+#
+# Builds an index of made-up pages straight into the tables the
+# searcher reads (postings, pagerank, link, linkwords), trains the
+# network on a few clicks, and then times random one and two word
+# queries through the top-k path and through full scoring.
+#
+#   python topkbench.py [pages] [queries] [dbname]
+#
+# Run it from an empty directory, the searcher keeps its network in
+# nn.db in the current directory.
+
+import sys
+import time
+import random
+from pysqlite2 import dbapi2 as sqlite
+import postings
+import searchengine
+
+def zipfword(nwords):
+  # Word ranks roughly follow Zipf's law
+  return min(int(random.paretovariate(1.0)),nwords)
+
+def buildindex(dbname,npages=1000000,nwords=20000,density=0.3):
+  random.seed(0)
+  con=sqlite.connect(dbname)
+  for table in ['urllist','wordlist','postings','pagerank','link','linkwords']:
+    con.execute('drop table if exists %s' % table)
+  con.execute('create table urllist(url)')
+  con.execute('create table wordlist(word)')
+  con.execute('create table postings(wordid integer primary key,ndocs integer,data blob)')
+  con.execute('create table pagerank(urlid primary key,score)')
+  con.execute('create table link(fromid integer,toid integer)')
+  con.execute('create table linkwords(wordid,linkid)')
+  con.execute('create index wordidx on wordlist(word)')
+  con.execute('create index urltoidx on link(toid)')
+
+  con.executemany('insert into urllist(url) values (?)',
+                  (('http://bench/%d' % i,) for i in xrange(npages)))
+  con.executemany('insert into wordlist(word) values (?)',
+                  (('w%d' % i,) for i in xrange(1,nwords+1)))
+  con.executemany('insert into pagerank(urlid,score) values (?,?)',
+                  ((i,0.15+random.expovariate(1.0)) for i in xrange(1,npages+1)))
+
+  # The n-th most common word is on about density/n of the pages
+  for wordid in xrange(1,nwords+1):
+    ndocs=max(1,int(npages*density/wordid))
+    urlids=random.sample(xrange(1,npages+1),ndocs)
+    urlids.sort()
+    pages=[]
+    for urlid in urlids:
+      locations=random.sample(xrange(500),random.randint(1,3))
+      locations.sort()
+      pages.append((urlid,locations))
+    con.execute('insert into postings(wordid,ndocs,data) values (?,?,?)',
+                (wordid,ndocs,sqlite.Binary(postings.encodepostings(pages))))
+
+  for linkid in xrange(1,npages/2+1):
+    con.execute('insert into link(fromid,toid) values (%d,%d)' %
+                (random.randint(1,npages),random.randint(1,npages)))
+    con.execute('insert into linkwords(wordid,linkid) values (%d,%d)' %
+                (zipfword(nwords),linkid))
+  con.commit()
+  con.close()
+
+def trainclicks(s,queries,clicks=200):
+  try: searchengine.mynet.maketables()
+  except sqlite.OperationalError: pass
+  for i in range(clicks):
+    matches,wordids=s.getmatchrows(random.choice(queries))
+    if len(matches)==0: continue
+    urlids=random.sample(matches.keys(),min(10,len(matches)))
+    searchengine.mynet.trainquery(wordids,urlids,random.choice(urlids))
+
+def percentile(times,p):
+  times=sorted(times)
+  return times[min(len(times)-1,int(len(times)*p/100.0))]
+
+def timequeries(f,queries):
+  times=[]
+  for q in queries:
+    start=time.time()
+    f(q)
+    times.append(time.time()-start)
+  return times
+
+def run(npages=1000000,nqueries=50,dbname='topkbench.db'):
+  print 'Building index of %d pages' % npages
+  start=time.time()
+  buildindex(dbname,npages)
+  print 'Built in %.1fs' % (time.time()-start)
+
+  random.seed(1)
+  s=searchengine.searcher(dbname)
+  queries=['w%d' % random.randint(1,200) for i in range(nqueries/2)]
+  queries+=['w%d w%d' % (random.randint(1,50),random.randint(1,200))
+            for i in range(nqueries-nqueries/2)]
+  trainclicks(s,queries)
+
+  def topk(q):
+    matches,wordids=s.getmatchrows(q)
+    return s.gettopk(matches,wordids,10)
+
+  def full(q):
+    matches,wordids=s.getmatchrows(q)
+    if len(matches)==0: return []
+    scores=s.getscoredlist(matches,wordids)
+    rankedscores=[(score,url) for (url,score) in scores.items()]
+    rankedscores.sort()
+    rankedscores.reverse()
+    return rankedscores[0:10]
+
+  # Load the link scores and network weights before timing either
+  for q in queries: full(q)
+
+  for (name,f) in [('top-k',topk),('full',full)]:
+    times=timequeries(f,queries)
+    print '%-6s p50 %8.1fms  p99 %8.1fms' % (name,percentile(times,50)*1000,
+                                            percentile(times,99)*1000)
+
+  scored=connected=0
+  for q in queries:
+    matches,wordids=s.getmatchrows(q)
+    s.gettopk(matches,wordids,10)
+    scored+=s.scored
+    connected+=len(searchengine.mynet.getconnectedurls(matches.keys()))
+  print 'top-k ran %d of %d connected pages through the network' % (scored,connected)
+
+if __name__=='__main__':
+  args=[int(a) for a in sys.argv[1:3]]
+  if len(sys.argv)>3: args.append(sys.argv[3])
+  run(*args)
@@ -1,5 +1,6 @@
 import random
 import math
+import heapq
 
 # The dorms, each of which has two available spaces
 dorms=['Zeus','Athena','Hercules','Bacchus','Pluto']
@@ -55,3 +56,178 @@ def dormcost(vec):
     del slots[x]
     
   return cost
+
+# What student i pays for being put in dorm
+def studentcost(i,dorm):
+  pref=prefs[i][1]
+  if pref[0]==dorm: return 0
+  elif pref[1]==dorm: return 1
+  else: return 3
+
+# dormcost for one solution that is changed a value at a time. A
+# student's choice decides which slots are left for everyone after
+# them, so the slots left and the cost so far are kept before each
+# student, and a change only goes over the students from there on.
+class dormstate:
+  def __init__(self,vec):
+    self.vec=list(vec)
+    slots=[]
+    for i in range(len(dorms)): slots+=[i,i]
+    self.slots=[slots]
+    self.costs=[0]
+    self.assign(0)
+
+  # Work out the slots and costs from student start onwards
+  def assign(self,start):
+    del self.slots[start+1:]
+    del self.costs[start+1:]
+    slots=list(self.slots[start])
+    cost=self.costs[start]
+    for i in range(start,len(self.vec)):
+      x=int(self.vec[i])
+      cost+=studentcost(i,dorms[slots[x]])
+      del slots[x]
+      self.slots.append(list(slots))
+      self.costs.append(cost)
+    self.cost=cost
+
+  def delta(self,i,value):
+    slots=list(self.slots[i])
+    cost=self.costs[i]
+    for j in range(i,len(self.vec)):
+      if j==i: x=int(value)
+      else: x=int(self.vec[j])
+      cost+=studentcost(j,dorms[slots[x]])
+      del slots[x]
+    return cost-self.cost
+
+  def move(self,i,value):
+    self.vec[i]=value
+    self.assign(i)
+
+dormcost.incremental=dormstate
+
+# The best possible assignment, worked out directly as a min-cost
+# matching of students to dorms instead of searching for it.
+# capacities[j] is how many students dorms[j] takes. A student's n-th
+# choice costs n-1 and a dorm they didn't list costs unlisted, which is
+# one more than their longest list or 3, as in dormcost. Returns the
+# index of the dorm for each student.
+#
+# A dorm that isn't on a student's list costs them the same as any
+# other, and there are always enough places left over for everyone who
+# doesn't get a dorm from their list. So only the listed dorms are
+# matched, and a student can also go "anywhere" for unlisted; the
+# anywhere students fill the places left at the end.
+#
+# Everyone who can have their first choice gets it. The rest are added
+# one at a time along the cheapest path of moves, found with
+# Dijkstra's algorithm, that ends in a listed dorm with room or with
+# someone going anywhere. Potentials on students and dorms keep the
+# costs it looks at non-negative and the assignment the cheapest
+# possible for the students added so far.
+def assign(dorms,prefs,capacities,unlisted=None):
+  ndorms=len(dorms)
+  nstudents=len(prefs)
+  if sum(capacities)<nstudents:
+    raise ValueError('%d students but only %d places' % (nstudents,sum(capacities)))
+  index=dict([(dorms[j],j) for j in range(ndorms)])
+  choices=[[index[d] for d in pref] for (name,pref) in prefs]
+  if unlisted==None: unlisted=max([3]+[len(c)+1 for c in choices])
+
+  members=[set() for j in range(ndorms)]
+  # -1 for students who go anywhere
+  assignment=[None]*nstudents
+  u=[0.0]*nstudents
+  v=[0.0]*ndorms
+
+  waiting=[]
+  for i in range(nstudents):
+    if len(choices[i])>0 and len(members[choices[i][0]])<capacities[choices[i][0]]:
+      members[choices[i][0]].add(i)
+      assignment[i]=choices[i][0]
+    else: waiting.append(i)
+
+  for student in waiting:
+    dist={}
+    via={}
+    heap=[]
+    # The cheapest way found so far to end the path by sending someone
+    # anywhere, and who
+    anywhere=(unlisted-u[student],student)
+    for rank in range(len(choices[student])):
+      k=choices[student][rank]
+      d=rank-u[student]-v[k]
+      if d<dist.get(k,anywhere[0]):
+        dist[k]=d
+        via[k]=student
+        heapq.heappush(heap,(d,k))
+
+    done=[]
+    end=None
+    while len(heap)>0:
+      d,j=heapq.heappop(heap)
+      if d>=anywhere[0]: break
+      if d>dist[j]: continue
+      if len(members[j])<capacities[j]:
+        end=j
+        break
+      done.append(j)
+
+      # Everyone in a full dorm can move on to another one
+      for t in members[j]:
+        if d+unlisted-u[t]<anywhere[0]: anywhere=(d+unlisted-u[t],t)
+        for rank in range(len(choices[t])):
+          k=choices[t][rank]
+          nd=d+rank-u[t]-v[k]
+          if nd<dist.get(k,anywhere[0]):
+            dist[k]=nd
+            via[k]=t
+            heapq.heappush(heap,(nd,k))
+
+    if end==None: total=anywhere[0]
+    else: total=dist[end]
+    u[student]+=total
+    for j in done:
+      v[j]-=total-dist[j]
+      for t in members[j]: u[t]+=total-dist[j]
+
+    # Move everyone along the path, from its end back
+    if end==None:
+      t=anywhere[1]
+      j=assignment[t]
+      assignment[t]=-1
+      if j==None: continue
+      members[j].discard(t)
+    else: j=end
+    while 1:
+      t=via[j]
+      previous=assignment[t]
+      members[j].add(t)
+      assignment[t]=j
+      if previous==None: break
+      members[previous].discard(t)
+      j=previous
+
+  # Whoever goes anywhere takes the places that are left
+  left=[j for j in range(ndorms) for n in range(capacities[j]-len(members[j]))]
+  for i in range(nstudents):
+    if assignment[i]==-1: assignment[i]=left.pop()
+  return assignment
+
+# An assignment as a solution of the kind dormcost and printsolution
+# take, where each student picks from the slots that are left
+def tovector(assignment,capacities=None):
+  if capacities==None: capacities=[2]*len(dorms)
+  slots=[]
+  for j in range(len(capacities)): slots+=[j]*capacities[j]
+  vec=[]
+  for j in assignment:
+    x=slots.index(j)
+    vec.append(x)
+    del slots[x]
+  return vec
+
+# The best solution to this module's problem
+def optimalsolution():
+  return tovector(assign(dorms,prefs,[2]*len(dorms)))
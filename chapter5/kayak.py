@@ -1,83 +1,138 @@
 import time
+import heapq
+import urllib
 import urllib2
-import xml.dom.minidom
+import threading
+from multiprocessing.pool import ThreadPool
+from xml.etree import cElementTree
 
 kayakkey='YOUR KEY HERE'
 
+# Where requests go, point this at kayakmock.py to test
+kayakhost='http://www.kayak.com'
+
+# Results of finished searches, by (origin,destination,date)
+searchcache={}
+cachelock=threading.Lock()
+
+# Read the text of the given tags from an XML response as it arrives,
+# returning {tag:[text,...]} in document order
+def gettags(url,tags):
+  found=dict([(tag,[]) for tag in tags])
+  for event,elem in cElementTree.iterparse(urllib2.urlopen(url)):
+    if elem.tag in found: found[elem.tag].append(elem.text)
+    elem.clear()
+  return found
+
 def getkayaksession():
   # Construct the URL to start a session
-  url='http://www.kayak.com/k/ident/apisession?token=%s&version=1' % kayakkey
-  
-  # Parse the resulting XML
-  doc=xml.dom.minidom.parseString(urllib2.urlopen(url).read())
-  
+  url='%s/k/ident/apisession?token=%s&version=1' % (kayakhost,urllib.quote(kayakkey))
+
   # Find <sid>xxxxxxxx</sid>
-  sid=doc.getElementsByTagName('sid')[0].firstChild.data
-  return sid
+  return gettags(url,['sid'])['sid'][0]
 
 def flightsearch(sid,origin,destination,depart_date):
-  
+
   # Construct search URL
-  url='http://www.kayak.com/s/apisearch?basicmode=true&oneway=y&origin=%s' % origin
+  url='%s/s/apisearch?basicmode=true&oneway=y&origin=%s' % (kayakhost,origin)
   url+='&destination=%s&depart_date=%s' % (destination,depart_date)
   url+='&return_date=none&depart_time=a&return_time=a'
   url+='&travelers=1&cabin=e&action=doFlights&apimode=1'
   url+='&_sid_=%s&version=1' % (sid)
 
-  # Get the XML
-  doc=xml.dom.minidom.parseString(urllib2.urlopen(url).read())
-
   # Extract the search ID
-  searchid=doc.getElementsByTagName('searchid')[0].firstChild.data
+  return gettags(url,['searchid'])['searchid'][0]
 
-  return searchid
+# True while Kayak is still finding flights for a search
+def morepending(sid,searchid):
+  url='%s/s/basic/flight?' % kayakhost
+  url+='searchid=%s&c=5&apimode=1&_sid_=%s&version=1' % (searchid,sid)
+  pending=gettags(url,['morepending'])['morepending']
+  return len(pending)>0 and pending[0]!=None and pending[0]!='false'
 
-def flightsearchresults(sid,searchid):
-  def parseprice(p): 
+# The complete list of flights of a finished search
+def getflights(sid,searchid):
+  def parseprice(p):
     return float(p[1:].replace(',',''))
 
-  # Polling loop
+  url='%s/s/basic/flight?' % kayakhost
+  url+='searchid=%s&c=999&apimode=1&_sid_=%s&version=1' % (searchid,sid)
+  found=gettags(url,['price','depart','arrive'])
+
+  # Zip them together
+  return zip([p.split(' ')[1] for p in found['depart']],
+             [p.split(' ')[1] for p in found['arrive']],
+             [parseprice(p) for p in found['price']])
+
+# Wait for one search to finish, checking less often the longer it takes
+def flightsearchresults(sid,searchid,mindelay=0.25,maxdelay=4.0,backoff=1.5):
+  delay=mindelay
   while 1:
-    time.sleep(2)
+    time.sleep(delay)
+    if not morepending(sid,searchid): break
+    delay=min(delay*backoff,maxdelay)
+  return getflights(sid,searchid)
 
-    # Construct URL for polling
-    url='http://www.kayak.com/s/basic/flight?'
-    url+='searchid=%s&c=5&apimode=1&_sid_=%s&version=1' % (searchid,sid)
-    doc=xml.dom.minidom.parseString(urllib2.urlopen(url).read())
+# Run the searches for a list of (origin,destination,date) legs all at
+# once. One loop polls every search when it is due, backing off each one
+# separately, and the requests themselves go out from a pool of threads.
+# Returns {leg:flights}.
+def searchlegs(sid,legs,workers=8,mindelay=0.25,maxdelay=4.0,backoff=1.5):
+  cachelock.acquire()
+  try:
+    pending=[]
+    for leg in legs:
+      if leg not in searchcache and leg not in pending: pending.append(leg)
+  finally:
+    cachelock.release()
 
-    # Look for morepending tag, and wait until it is no longer true
-    morepending=doc.getElementsByTagName('morepending')[0].firstChild
-    if morepending==None or morepending.data=='false': break
+  if len(pending)>0:
+    pool=ThreadPool(min(workers,len(pending)))
+    try:
+      searchids=pool.map(lambda leg: flightsearch(sid,*leg),pending)
+      now=time.time()
+      due=[(now+mindelay,leg,searchid,mindelay) for (leg,searchid) in zip(pending,searchids)]
+      heapq.heapify(due)
 
-  # Now download the complete list
-  url='http://www.kayak.com/s/basic/flight?'
-  url+='searchid=%s&c=999&apimode=1&_sid_=%s&version=1' % (searchid,sid)
-  doc=xml.dom.minidom.parseString(urllib2.urlopen(url).read())
+      while len(due)>0:
+        wait=due[0][0]-time.time()
+        if wait>0: time.sleep(wait)
+        now=time.time()
+        polls=[]
+        while len(due)>0 and due[0][0]<=now: polls.append(heapq.heappop(due))
 
-  # Get the various elements as lists
-  prices=doc.getElementsByTagName('price')
-  departures=doc.getElementsByTagName('depart')
-  arrivals=doc.getElementsByTagName('arrive')  
+        states=pool.map(lambda poll: morepending(sid,poll[2]),polls)
+        finished=[]
+        for (when,leg,searchid,delay),more in zip(polls,states):
+          if more:
+            delay=min(delay*backoff,maxdelay)
+            heapq.heappush(due,(now+delay,leg,searchid,delay))
+          else: finished.append((leg,searchid))
 
-  # Zip them together
-  return zip([p.firstChild.data.split(' ')[1] for p in departures],
-             [p.firstChild.data.split(' ')[1] for p in arrivals],
-             [parseprice(p.firstChild.data) for p in prices])
+        results=pool.map(lambda (leg,searchid): getflights(sid,searchid),finished)
+        cachelock.acquire()
+        try:
+          for (leg,searchid),flights in zip(finished,results): searchcache[leg]=flights
+        finally:
+          cachelock.release()
+    finally:
+      pool.close()
+      pool.join()
 
+  return dict([(leg,searchcache[leg]) for leg in legs])
 
-def createschedule(people,dest,dep,ret):
+def createschedule(people,dest,dep,ret,workers=8):
   # Get a session id for these searches
   sid=getkayaksession()
-  flights={}
-  
+
+  # Outbound and return flights for everyone
+  legs={}
   for p in people:
     name,origin=p
-    # Outbound flight
-    searchid=flightsearch(sid,origin,dest,dep)
-    flights[(origin,dest)]=flightsearchresults(sid,searchid)
-    
-    # Return flight
-    searchid=flightsearch(sid,dest,origin,ret)
-    flights[(dest,origin)]=flightsearchresults(sid,searchid)
-    
+    legs[(origin,dest)]=(origin,dest,dep)
+    legs[(dest,origin)]=(dest,origin,ret)
+
+  results=searchlegs(sid,legs.values(),workers)
+  flights={}
+  for key,leg in legs.items(): flights[key]=results[leg]
   return flights
@@ -0,0 +1,118 @@
+import time
+import random
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+import kayak
+
+# A stand-in for the parts of the Kayak API that kayak.py uses, for
+# trying the searches out without a key. Each search keeps answering
+# morepending for searchtime seconds and then has a day of made up
+# flights between its two airports.
+
+class kayakhandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def do_GET(self):
+    path,query=self.path.split('?',1)
+    args=dict(urlparse.parse_qsl(query))
+    server=self.server
+    if path=='/k/ident/apisession':
+      body='<ident><sid>mock-session</sid></ident>'
+    elif path=='/s/apisearch':
+      server.lock.acquire()
+      try:
+        searchid=str(len(server.searches)+1)
+        server.searches[searchid]=(args['origin'],args['destination'],
+                                   args['depart_date'],time.time())
+        server.started+=1
+      finally:
+        server.lock.release()
+      body='<search><searchid>%s</searchid></search>' % searchid
+    elif path=='/s/basic/flight':
+      origin,destination,date,started=server.searches[args['searchid']]
+      server.lock.acquire()
+      server.polls+=1
+      server.lock.release()
+      if time.time()-started<server.searchtime:
+        body='<searchresult><morepending>true</morepending></searchresult>'
+      else:
+        trips=maketrips(origin,destination,date)[0:int(args['c'])]
+        body='<searchresult><morepending>false</morepending><trips>%s</trips></searchresult>' % ''.join(trips)
+    else:
+      self.send_error(404)
+      return
+    self.send_response(200)
+    self.send_header('Content-Type','text/xml')
+    self.send_header('Content-Length',str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self,format,*args):
+    pass
+
+# The same flights every time for the same airports and day
+def maketrips(origin,destination,date):
+  r=random.Random('%s %s %s' % (origin,destination,date))
+  trips=[]
+  for i in range(10):
+    depart=r.randint(6*60,20*60)
+    arrive=depart+r.randint(60,6*60)
+    trips.append('<trip><price>$%d</price><legs><leg>'
+                 '<depart>%s %d:%02d</depart><arrive>%s %d:%02d</arrive>'
+                 '</leg></legs></trip>' %
+                 (r.randint(80,600),date,depart/60,depart%60,
+                  date,(arrive/60)%24,arrive%60))
+  return trips
+
+class kayakserver(SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer):
+  daemon_threads=True
+  request_queue_size=64
+  def __init__(self,address,searchtime):
+    BaseHTTPServer.HTTPServer.__init__(self,address,kayakhandler)
+    self.searchtime=searchtime
+    self.searches={}
+    self.started=0
+    self.polls=0
+    self.lock=threading.Lock()
+
+# Start a mock server in the background and point kayak.py at it
+def serve(searchtime=3.0,port=0):
+  server=kayakserver(('127.0.0.1',port),searchtime)
+  thread=threading.Thread(target=server.serve_forever)
+  thread.setDaemon(1)
+  thread.start()
+  kayak.kayakhost='http://127.0.0.1:%d' % server.server_address[1]
+  return server
+
+# Time createschedule against searching one leg after another the way
+# it used to
+def run(people=None,dest='LGA',dep='11/17/2006',ret='11/18/2006',searchtime=3.0):
+  if people==None:
+    import optimization
+    people=optimization.people
+  server=serve(searchtime)
+
+  start=time.time()
+  sid=kayak.getkayaksession()
+  serial={}
+  for name,origin in people:
+    serial[(origin,dest)]=kayak.flightsearchresults(sid,kayak.flightsearch(sid,origin,dest,dep))
+    serial[(dest,origin)]=kayak.flightsearchresults(sid,kayak.flightsearch(sid,dest,origin,ret))
+  print 'one at a time: %.2fs, %d polls' % (time.time()-start,server.polls)
+
+  server.polls=0
+  kayak.searchcache.clear()
+  start=time.time()
+  flights=kayak.createschedule(people,dest,dep,ret)
+  print 'all at once:   %.2fs, %d polls' % (time.time()-start,server.polls)
+
+  start=time.time()
+  kayak.createschedule(people,dest,dep,ret)
+  print 'cached:        %.2fs' % (time.time()-start)
+
+  print 'same flights:',flights==serial
+  server.shutdown()
+  return flights
+
+if __name__=='__main__':
+  run()
@@ -0,0 +1,156 @@
+import numpy as np
+from socialnetwork import expandranges
+
+# Force-directed layout (Fruchterman-Reingold) for graphs too big to
+# lay out by optimizing crosscount. Every node pushes every other node
+# away and links pull their ends together; the nodes move along the
+# total force by no more than a temperature that cools each iteration.
+#
+# The pushing is approximated Barnes-Hut style with a quadtree kept as
+# a grid per level. At each level a node feels the nodes of every cell
+# that isn't next to its own cell but is next to its parent cell's, as
+# one mass at their center, so every far away node is counted once at
+# the coarsest level where it is well separated. Nodes in the
+# neighbouring cells of the finest level are counted exactly.
+#
+# Started at random, a big graph folds over itself before it cools, so
+# it is laid out multilevel: the ends of links are merged into one node
+# over and over until the graph is small, that is laid out, and then
+# each finer graph starts from the layout of the one it was merged into
+# and only needs a short, cool run. The number of levels, and so the
+# work, grows with the size of the graph.
+
+# The force pushing nodes apart. With the ideal link length 1, the
+# push of mass m at distance d is m/d.
+def repulsion(pos,leafsize=2):
+  n=len(pos)
+  low=pos.min(axis=0)
+  extent=max((pos.max(axis=0)-low).max(),1e-9)*1.000001
+  u=(pos-low)/extent
+  depth=max(2,int(np.ceil(np.log2(np.sqrt(float(n)/leafsize)))))
+  force=np.zeros((n,2))
+
+  for level in range(2,depth+1):
+    size=2**level
+    cell=np.minimum((u*size).astype(int),size-1)
+    cellid=cell[:,0]*size+cell[:,1]
+    mass=np.bincount(cellid,minlength=size*size).astype(float)
+    com=np.zeros((size*size,2))
+    filled=mass>0
+    for axis in range(2):
+      com[filled,axis]=np.bincount(cellid,weights=pos[:,axis],
+                                   minlength=size*size)[filled]/mass[filled]
+
+    # The 6x6 children of the parent's neighbours, less our neighbours
+    parent=cell/2
+    for dx in range(6):
+      x=parent[:,0]*2-2+dx
+      for dy in range(6):
+        y=parent[:,1]*2-2+dy
+        far=(x>=0)&(x<size)&(y>=0)&(y<size)
+        far&=(np.abs(x-cell[:,0])>1)|(np.abs(y-cell[:,1])>1)
+        nodes=np.nonzero(far)[0]
+        cells=(x*size+y)[nodes]
+        nodes,cells=nodes[filled[cells]],cells[filled[cells]]
+        delta=pos[nodes]-com[cells]
+        d2=np.maximum((delta**2).sum(axis=1),1e-9)
+        force[nodes]+=delta*(mass[cells]/d2)[:,None]
+
+  # Exactly, for nodes in the same or neighbouring cells at the finest level
+  keys=np.sort(cellid)
+  order=np.argsort(cellid,kind='mergesort')
+  for dx in (-1,0,1):
+    for dy in (-1,0,1):
+      x,y=cell[:,0]+dx,cell[:,1]+dy
+      inside=(x>=0)&(x<size)&(y>=0)&(y<size)
+      starts=np.searchsorted(keys,x*size+y,side='left')
+      ends=np.searchsorted(keys,x*size+y,side='right')
+      ends[~inside]=starts[~inside]
+      nodes,positions=expandranges(starts,ends)
+      others=order[positions]
+      keep=nodes!=others
+      nodes,others=nodes[keep],others[keep]
+      delta=pos[nodes]-pos[others]
+      d2=np.maximum((delta**2).sum(axis=1),1e-9)
+      for axis in range(2):
+        force[:,axis]+=np.bincount(nodes,weights=delta[:,axis]/d2,minlength=n)
+  return force
+
+# The force pulling the ends of each link together, d*d at distance d
+def attraction(pos,ends):
+  a,b=ends[:,0],ends[:,1]
+  delta=pos[a]-pos[b]
+  d=np.sqrt((delta**2).sum(axis=1))
+  pull=delta*d[:,None]
+  force=np.zeros(pos.shape)
+  for axis in range(2):
+    force[:,axis]-=np.bincount(a,weights=pull[:,axis],minlength=len(pos))
+    force[:,axis]+=np.bincount(b,weights=pull[:,axis],minlength=len(pos))
+  return force
+
+# Scale positions to fill [low,high] in both directions, keeping their
+# shape, as a list of x,y pairs the way drawnetwork and crosscount
+# take them
+def fitlayout(pos,low=10,high=390):
+  pos=pos-pos.min(axis=0)
+  extent=max(pos.max(),1e-9)
+  return (pos/extent*(high-low)+low).ravel().tolist()
+
+# Merges the ends of as many links as can be merged without merging a
+# node twice, taking links in random order. Returns how many nodes are
+# left, the links between them, each once, and which one each node
+# went into.
+def coarsen(n,ends,rand):
+  group=-np.ones(n,dtype=int)
+  count=0
+  for a,b in ends[rand.permutation(len(ends))].tolist():
+    if a!=b and group[a]<0 and group[b]<0:
+      group[a]=group[b]=count
+      count+=1
+  single=np.nonzero(group<0)[0]
+  group[single]=np.arange(count,count+len(single))
+  m=count+len(single)
+  merged=np.sort(group[ends],axis=1)
+  merged=merged[merged[:,0]!=merged[:,1]]
+  keys=np.unique(merged[:,0]*m+merged[:,1])
+  return m,np.column_stack((keys/m,keys%m)).reshape(-1,2),group
+
+# Moves the nodes along their force by no more than a temperature that
+# cools evenly from start to nothing
+def settle(pos,ends,iterations,start,leafsize):
+  for i in range(iterations):
+    force=repulsion(pos,leafsize)+attraction(pos,ends)
+    length=np.sqrt((force**2).sum(axis=1))
+    length[length==0]=1.0
+    t=start*(1.0-float(i)/iterations)
+    pos+=force/length[:,None]*np.minimum(length,t)[:,None]
+  return pos
+
+# iterations is for the smallest graph, every finer one gets refine
+def forcelayout(people,links,iterations=50,size=400,margin=10,seed=0,leafsize=2,
+                refine=20,coarsest=50):
+  index=dict([(people[i],i) for i in range(len(people))])
+  ends=np.array([(index[a],index[b]) for (a,b) in links],dtype=int).reshape(-1,2)
+  n=len(people)
+  rand=np.random.RandomState(seed)
+
+  # Merge until the graph is small or stops getting much smaller
+  levels=[]
+  while n>coarsest:
+    m,merged,group=coarsen(n,ends,rand)
+    if m>0.9*n: break
+    levels.append((ends,group))
+    n,ends=m,merged
+
+  # Start at random in a square with room for every node
+  side=np.sqrt(n)
+  pos=settle(rand.uniform(0,side,(n,2)),ends,iterations,side/10.0,leafsize)
+
+  # Each node starts where the node it was merged into is, spread out
+  # to make room for the extra nodes and nudged apart from its partner
+  for ends,group in reversed(levels):
+    pos=pos[group]*np.sqrt(float(len(group))/len(pos))
+    pos+=rand.uniform(-0.1,0.1,pos.shape)
+    pos=settle(pos,ends,refine,1.0,leafsize)
+
+  return fitlayout(pos,margin,size-margin)
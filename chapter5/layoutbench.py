@@ -0,0 +1,72 @@
+# Compares forcelayout with laying out a graph by annealing on its
+# crossing count, the way the social network graph is laid out, on the
+# graph in socialnetwork.py and on bigger made-up ones. Prints the time
+# each takes and how many links cross in the result. For the made-up
+# meshes the crossings of the mesh drawn as the grid it was made from
+# are printed too, as a layout to compare against.
+#
+#   python layoutbench.py [largest graph size]
+#
+# Annealing is only timed on graphs of up to annealmax nodes, it takes
+# minutes beyond that.
+
+import sys
+import time
+import random
+import numpy as np
+import optimization
+import socialnetwork
+import layout
+
+# A square grid of nodes, a graph that can be drawn with no crossings,
+# plus a few random links so it can't quite
+def meshgraph(n,extra=0.02,seed=0):
+  random.seed(seed)
+  width=max(2,int(n**0.5))
+  people=[str(i) for i in range(width*width)]
+  links=[]
+  for i in range(width):
+    for j in range(width):
+      if i+1<width: links.append((str(i*width+j),str((i+1)*width+j)))
+      if j+1<width: links.append((str(i*width+j),str(i*width+j+1)))
+  for k in range(int(len(links)*extra)):
+    links.append((random.choice(people),random.choice(people)))
+  return people,links
+
+# The nodes of meshgraph on their grid
+def gridlayout(people):
+  width=int(len(people)**0.5)
+  pos=np.array([(i/width,i%width) for i in range(len(people))],dtype=float)
+  return layout.fitlayout(pos)
+
+def anneal(people,links,costf):
+  domain=[(10,390)]*(len(people)*2)
+  return optimization.annealingoptimize(domain,costf,step=50,cool=0.99)
+
+def run(largest=10000,annealmax=100):
+  graphs=[('social',socialnetwork.people,socialnetwork.links)]
+  size=100
+  while size<=largest:
+    people,links=meshgraph(size)
+    graphs.append(('mesh%d' % size,people,links))
+    size*=10
+
+  print '%-10s %6s %6s %-8s %8s %9s' % ('graph','nodes','links','method','seconds','crossings')
+  for name,people,links in graphs:
+    cost=socialnetwork.layoutcost(people,links)
+    if name=='social': costf=socialnetwork.crosscount
+    else: costf=cost
+    methods=[('force',lambda: layout.forcelayout(people,links))]
+    if name!='social': methods.append(('grid',lambda: gridlayout(people)))
+    if len(people)<=annealmax: methods.append(('anneal',lambda: anneal(people,links,costf)))
+    for method,f in methods:
+      random.seed(0)
+      start=time.time()
+      sol=f()
+      elapsed=time.time()-start
+      crossings=cost.crossings(np.array(sol,dtype=float).reshape(-1,2))
+      print '%-10s %6d %6d %-8s %8.2f %9d' % (name,len(people),len(links),method,
+                                              elapsed,crossings)
+
+if __name__=='__main__':
+  run(*[int(a) for a in sys.argv[1:2]])
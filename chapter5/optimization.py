@@ -1,6 +1,11 @@
 import time
 import random
 import math
+import bisect
+import csv
+import json
+import numpy as np
+from multiprocessing import Pool,Process,Queue,cpu_count
 
 people = [('Seymour','BOS'),
           ('Franny','DAL'),
@@ -24,6 +29,24 @@ def getminutes(t):
   x=time.strptime(t,'%H:%M')
   return x[3]*60+x[4]
 
+# The flights again with the times already in minutes, as
+# (depart,arrive,price), so the cost function never parses a time
+flightminutes=dict([(key,[(getminutes(d),getminutes(a),p) for (d,a,p) in f])
+                    for (key,f) in flights.items()])
+
+# The same for every person as arrays indexed by [person,flight], for
+# scoring many solutions at once. People with fewer flights are padded.
+def flighttable(key,field):
+  rows=[[f[field] for f in flightminutes[key(origin)]] for (name,origin) in people]
+  table=np.zeros((len(rows),max([len(r) for r in rows])),dtype=int)
+  for d in range(len(rows)): table[d,0:len(rows[d])]=rows[d]
+  return table
+
+outarrive=flighttable(lambda origin: (origin,destination),1)
+outprice=flighttable(lambda origin: (origin,destination),2)
+retdepart=flighttable(lambda origin: (destination,origin),0)
+retprice=flighttable(lambda origin: (destination,origin),2)
+
 def printschedule(r):
   for d in range(len(r)/2):
     name=people[d][0]
@@ -42,53 +65,380 @@ def schedulecost(sol):
   for d in range(len(sol)/2):
     # Get the inbound and outbound flights
     origin=people[d][1]
-    outbound=flights[(origin,destination)][int(sol[d])]
-    returnf=flights[(destination,origin)][int(sol[d+1])]
-    
+    outbound=flightminutes[(origin,destination)][int(sol[d])]
+    returnf=flightminutes[(destination,origin)][int(sol[d+1])]
+
     # Total price is the price of all outbound and return flights
     totalprice+=outbound[2]
     totalprice+=returnf[2]
-    
+
     # Track the latest arrival and earliest departure
-    if latestarrival<getminutes(outbound[1]): latestarrival=getminutes(outbound[1])
-    if earliestdep>getminutes(returnf[0]): earliestdep=getminutes(returnf[0])
+    if latestarrival<outbound[1]: latestarrival=outbound[1]
+    if earliestdep>returnf[0]: earliestdep=returnf[0]
   
   # Every person must wait at the airport until the latest person arrives.
   # They also must arrive at the same time and wait for their flights.
   totalwait=0  
   for d in range(len(sol)/2):
     origin=people[d][1]
-    outbound=flights[(origin,destination)][int(sol[d])]
-    returnf=flights[(destination,origin)][int(sol[d+1])]
-    totalwait+=latestarrival-getminutes(outbound[1])
-    totalwait+=getminutes(returnf[0])-earliestdep  
+    outbound=flightminutes[(origin,destination)][int(sol[d])]
+    returnf=flightminutes[(destination,origin)][int(sol[d+1])]
+    totalwait+=latestarrival-outbound[1]
+    totalwait+=returnf[0]-earliestdep
 
   # Does this solution require an extra day of car rental? That'll be $50!
   if latestarrival>earliestdep: totalprice+=50
-  
+
   return totalprice+totalwait
 
-def randomoptimize(domain,costf):
+# schedulecost for a whole population at once, one solution per row.
+# Returns the costs as a list.
+def schedulecosts(pop):
+  pop=np.asarray(pop).astype(int)
+  n=pop.shape[1]/2
+  d=np.arange(n)
+  out=pop[:,0:n]
+  ret=pop[:,1:n+1]
+
+  totalprice=outprice[d,out].sum(axis=1)+retprice[d,ret].sum(axis=1)
+  arrive=outarrive[d,out]
+  depart=retdepart[d,ret]
+  latestarrival=np.maximum(arrive.max(axis=1),0)
+  earliestdep=np.minimum(depart.min(axis=1),24*60)
+
+  totalwait=(latestarrival[:,None]-arrive).sum(axis=1)
+  totalwait+=(depart-earliestdep[:,None]).sum(axis=1)
+  totalprice+=50*(latestarrival>earliestdep)
+  return (totalprice+totalwait).tolist()
+
+# schedulecost for one solution that is changed a value at a time.
+# Value j is person j's outbound flight and person j-1's return
+# flight, so a change only moves one arrival and one departure. The
+# arrivals and departures are kept sorted to find the new latest
+# arrival and earliest departure without looking at everyone.
+class schedulestate:
+  def __init__(self,sol):
+    self.vec=list(sol)
+    self.n=len(sol)/2
+    self.arrive=[self.flight(d,d)[1] for d in range(self.n)]
+    self.depart=[self.flight(d,d+1)[0] for d in range(self.n)]
+    self.price=sum([self.flight(d,d)[2]+self.flight(d,d+1)[2] for d in range(self.n)])
+    self.sumarrive=sum(self.arrive)
+    self.sumdepart=sum(self.depart)
+    self.sortedarrive=sorted(self.arrive)
+    self.sorteddepart=sorted(self.depart)
+    self.cost=self.total(self.price,self.sumarrive,self.sumdepart,
+                         self.sortedarrive[-1],self.sorteddepart[0])
+
+  # Person d's outbound flight if j==d, otherwise their return flight,
+  # using value j of the solution or value if one is given
+  def flight(self,d,j,value=None):
+    if value==None: value=self.vec[j]
+    origin=people[d][1]
+    if j==d: return flightminutes[(origin,destination)][int(value)]
+    return flightminutes[(destination,origin)][int(value)]
+
+  def total(self,price,sumarrive,sumdepart,latestarrival,earliestdep):
+    latestarrival=max(latestarrival,0)
+    earliestdep=min(earliestdep,24*60)
+    totalwait=self.n*latestarrival-sumarrive+sumdepart-self.n*earliestdep
+    if latestarrival>earliestdep: price+=50
+    return price+totalwait
+
+  # The totals if value j became value, along with the arrival and
+  # departure it replaces and the ones it brings in
+  def change(self,j,value):
+    price,sumarrive,sumdepart=self.price,self.sumarrive,self.sumdepart
+    latestarrival,earliestdep=self.sortedarrive[-1],self.sorteddepart[0]
+    arrival=departure=None
+    if j<self.n:
+      old,new=self.flight(j,j),self.flight(j,j,value)
+      price+=new[2]-old[2]
+      sumarrive+=new[1]-old[1]
+      # The latest of everyone else's arrivals
+      rest=self.sortedarrive[-1]
+      if rest==old[1]:
+        if self.n>1: rest=self.sortedarrive[-2]
+        else: rest=new[1]
+      latestarrival=max(rest,new[1])
+      arrival=(old[1],new[1])
+    if 1<=j<=self.n:
+      old,new=self.flight(j-1,j),self.flight(j-1,j,value)
+      price+=new[2]-old[2]
+      sumdepart+=new[0]-old[0]
+      rest=self.sorteddepart[0]
+      if rest==old[0]:
+        if self.n>1: rest=self.sorteddepart[1]
+        else: rest=new[0]
+      earliestdep=min(rest,new[0])
+      departure=(old[0],new[0])
+    return (price,sumarrive,sumdepart,latestarrival,earliestdep),arrival,departure
+
+  def delta(self,j,value):
+    totals,arrival,departure=self.change(j,value)
+    return self.total(*totals)-self.cost
+
+  def move(self,j,value):
+    totals,arrival,departure=self.change(j,value)
+    self.price,self.sumarrive,self.sumdepart=totals[0:3]
+    for times,change in [(self.sortedarrive,arrival),(self.sorteddepart,departure)]:
+      if change==None: continue
+      old,new=change
+      del times[bisect.bisect_left(times,old)]
+      bisect.insort(times,new)
+    self.vec[j]=value
+    self.cost=self.total(*totals)
+
+# Optimizers look for a batch form of the cost function here, and for
+# an incremental form to use when they change one value at a time
+schedulecost.batch=schedulecosts
+schedulecost.incremental=schedulestate
+
+# Cost of each solution in sols, all in one call if costf has a batch form
+def getcosts(costf,sols):
+  batch=getattr(costf,'batch',None)
+  if batch!=None and len(sols)>0: return batch(sols)
+  return [costf(sol) for sol in sols]
+
+# The incremental form of a cost function, for cost functions without
+# one. It works out the full cost of every change.
+class fullcoststate:
+  def __init__(self,costf,vec):
+    self.costf=costf
+    self.vec=list(vec)
+    self.cost=costf(self.vec)
+    self.last=None
+
+  def delta(self,i,value):
+    vec=self.vec[:]
+    vec[i]=value
+    self.last=(i,value,self.costf(vec))
+    return self.last[2]-self.cost
+
+  def move(self,i,value):
+    if self.last==None or self.last[0:2]!=(i,value): self.delta(i,value)
+    self.vec[i]=value
+    self.cost=self.last[2]
+    self.last=None
+
+# An object holding vec and its cost in .cost. delta(i,value) is how
+# much the cost would change if vec[i] became value, and move(i,value)
+# makes the change. Cost functions can provide a faster one as
+# costf.incremental(vec).
+def getstate(costf,vec):
+  incremental=getattr(costf,'incremental',None)
+  if incremental!=None: return incremental(vec)
+  return fullcoststate(costf,vec)
+
+# The cost function the pool's workers use. It is set before the pool
+# is started and the workers inherit it, so cost functions that can't
+# be pickled, like the ones createCostFunction makes in chapter 8,
+# still work.
+poolcostf=None
+
+def poolcost(sol):
+  return poolcostf(sol)
+
+# A pool whose workers use costf, or None to work in this process
+def startpool(costf,processes):
+  global poolcostf
+  poolcostf=costf
+  if processes==1: return None
+  return Pool(processes)
+
+# How many workers startpool starts for processes
+def poolsize(processes):
+  if processes==None: return cpu_count()
+  return processes
+
+def poolmap(pool,f,tasks):
+  if pool==None: return map(f,tasks)
+  return pool.map(f,tasks,1)
+
+def stoppool(pool):
+  if pool!=None:
+    pool.close()
+    pool.join()
+
+# Keeps a trace of an optimizer run, for comparing optimizers on real
+# cost functions. Pass one to an optimizer as recorder= and it adds a
+# row after every iteration with the cost it is at, the best cost so
+# far, how many costs have been worked out and how many were found in a
+# cache, the seconds since the start and how many of them were spent in
+# costf. Optimizers run without one don't pay anything for it.
+class recorder:
+  fields=['iteration','cost','best','evals','hits','seconds','costseconds']
+
+  def __init__(self,name=''):
+    self.name=name
+    self.rows=[]
+    self.best=None
+    self.evals=0
+    self.hits=0
+    self.costseconds=0.0
+    self.start=time.time()
+
+  # The run starts now
+  def begin(self):
+    self.start=time.time()
+
+  # costf, counting and timing the costs worked out with it. This is
+  # when the run starts.
+  def watch(self,costf):
+    self.begin()
+    return timedcost(self,costf)
+
+  # evals are costs worked out where watch() can't see them, such as
+  # in other processes. seconds is how far into the run the row is,
+  # for rows recorded after the fact.
+  def record(self,iteration,cost,hits=0,evals=0,seconds=None):
+    cost=float(cost)
+    if self.best==None or cost<self.best: self.best=cost
+    self.hits+=hits
+    self.evals+=evals
+    if seconds==None: seconds=time.time()-self.start
+    self.rows.append([iteration,cost,self.best,self.evals,self.hits,
+                      seconds,self.costseconds])
+
+  def tojson(self,path):
+    out=open(path,'w')
+    json.dump({'name':self.name,'fields':self.fields,'rows':self.rows},out)
+    out.close()
+
+  def tocsv(self,path):
+    out=open(path,'wb')
+    writer=csv.writer(out)
+    writer.writerow(self.fields)
+    writer.writerows(self.rows)
+    out.close()
+
+# A cost function that tells a recorder about every cost it works out,
+# with the same batch and incremental forms as the one it wraps
+class timedcost:
+  def __init__(self,recorder,costf):
+    self.recorder=recorder
+    self.costf=costf
+    if getattr(costf,'batch',None)!=None: self.batch=self.timedbatch
+    if getattr(costf,'incremental',None)!=None: self.incremental=self.timedstate
+
+  def count(self,n,start):
+    self.recorder.evals+=n
+    self.recorder.costseconds+=time.time()-start
+
+  def __call__(self,sol):
+    start=time.time()
+    cost=self.costf(sol)
+    self.count(1,start)
+    return cost
+
+  def timedbatch(self,sols):
+    start=time.time()
+    costs=self.costf.batch(sols)
+    self.count(len(sols),start)
+    return costs
+
+  def timedstate(self,vec):
+    start=time.time()
+    state=self.costf.incremental(vec)
+    self.count(1,start)
+    return timedstate(self,state)
+
+# An incremental state whose deltas are counted as costs worked out
+class timedstate:
+  def __init__(self,timed,state):
+    self.timed=timed
+    self.state=state
+
+  def __getattr__(self,name):
+    return getattr(self.state,name)
+
+  def delta(self,i,value):
+    start=time.time()
+    d=self.state.delta(i,value)
+    self.timed.count(1,start)
+    return d
+
+  def move(self,i,value):
+    start=time.time()
+    self.state.move(i,value)
+    self.timed.count(0,start)
+
+# Scores populations, remembering the cost of every solution it has
+# seen so that only new ones are evaluated. With processes other than
+# 1 new solutions are scored in a pool of processes (None for one per
+# CPU), which is worth it when costf is slow.
+class populationevaluator:
+  def __init__(self,costf,processes=1):
+    self.costf=costf
+    self.cache={}
+    self.pool=startpool(costf,processes)
+    self.processes=poolsize(processes)
+    # What the last call to costs did
+    self.evals=0
+    self.hits=0
+    self.elapsed=0.0
+
+  def costs(self,sols):
+    start=time.time()
+    keys=[tuple(sol) for sol in sols]
+    new=[]
+    for key in keys:
+      if key not in self.cache:
+        self.cache[key]=None
+        new.append(key)
+
+    if self.pool!=None and len(new)>0:
+      chunk=max(1,len(new)/(4*self.processes))
+      newcosts=self.pool.map(poolcost,[list(key) for key in new],chunk)
+      # The workers' counts don't come back
+      if isinstance(self.costf,timedcost): self.costf.count(len(new),start)
+    else:
+      newcosts=getcosts(self.costf,[list(key) for key in new])
+    for key,cost in zip(new,newcosts): self.cache[key]=cost
+
+    self.evals=len(new)
+    self.hits=len(keys)-len(new)
+    self.elapsed=time.time()-start
+    return [self.cache[key] for key in keys]
+
+  def close(self):
+    stoppool(self.pool)
+    self.pool=None
+
+def randomoptimize(domain,costf,recorder=None):
+  if recorder!=None: costf=recorder.watch(costf)
   best=999999999
   bestr=None
-  for i in range(0,1000):
-    # Create a random solution
-    r=[float(random.randint(domain[i][0],domain[i][1])) 
-       for i in range(len(domain))]
-    
-    # Get the cost
-    cost=costf(r)
-    
-    # Compare it to the best one so far
-    if cost<best:
-      best=cost
-      bestr=r 
-  return r
+  # Random solutions, scored a chunk at a time so the trace shows how
+  # the best cost went down
+  for start in range(0,1000,50):
+    sols=[[float(random.randint(domain[i][0],domain[i][1]))
+           for i in range(len(domain))] for j in range(start,start+50)]
+    costs=getcosts(costf,sols)
+    if recorder!=None: recorder.record(start/50,min(costs))
+
+    for r,cost in zip(sols,costs):
+      # Compare it to the best one so far
+      if cost<best:
+        best=cost
+        bestr=r 
+  return bestr
 
-def hillclimb(domain,costf):
+def hillclimb(domain,costf,recorder=None):
+  if recorder!=None: costf=recorder.watch(costf)
   # Create a random solution
   sol=[random.randint(domain[i][0],domain[i][1])
       for i in range(len(domain))]
+  return climb(domain,costf,sol,recorder=recorder)[0]
+
+# Hill climbing from sol. Stops at the top, or once maxevals costs have
+# been worked out. Returns (solution,cost,evaluations).
+def climb(domain,costf,sol,maxevals=None,recorder=None):
+  if getattr(costf,'incremental',None)!=None:
+    return climbincremental(domain,costf,sol,maxevals,recorder)
+  current=None
+  evals=0
+  step=0
   # Main loop
   while 1:
     # Create list of neighboring solutions
@@ -97,29 +447,72 @@ def hillclimb(domain,costf):
     for j in range(len(domain)):
       # One away in each direction
       if sol[j]>domain[j][0]:
-        neighbors.append(sol[0:j]+[sol[j]+1]+sol[j+1:])
-      if sol[j]<domain[j][1]:
         neighbors.append(sol[0:j]+[sol[j]-1]+sol[j+1:])
+      if sol[j]<domain[j][1]:
+        neighbors.append(sol[0:j]+[sol[j]+1]+sol[j+1:])
 
-    # See what the best solution amongst the neighbors is
-    current=costf(sol)
+    # See what the best solution amongst the neighbors is. The cost of
+    # the current one is known after the first time round.
+    if current==None:
+      costs=getcosts(costf,[sol]+neighbors)
+      current=costs.pop(0)
+      evals+=1
+    else:
+      costs=getcosts(costf,neighbors)
+    evals+=len(neighbors)
     best=current
     for j in range(len(neighbors)):
-      cost=costf(neighbors[j])
+      cost=costs[j]
       if cost<best:
         best=cost
         sol=neighbors[j]
+    if recorder!=None: recorder.record(step,best)
+    step+=1
 
     # If there's no improvement, then we've reached the top
-    if best==current:
+    if best==current or (maxevals!=None and evals>=maxevals):
       break
-  return sol
+    current=best
+  return sol,best,evals
+
+# climb for cost functions with an incremental form. Neighbours are
+# scored by how much they change the cost.
+def climbincremental(domain,costf,sol,maxevals=None,recorder=None):
+  state=costf.incremental(sol)
+  evals=1
+  step=0
+  while 1:
+    # One away in each direction
+    moves=[]
+    for j in range(len(domain)):
+      if state.vec[j]>domain[j][0]: moves.append((j,state.vec[j]-1))
+      if state.vec[j]<domain[j][1]: moves.append((j,state.vec[j]+1))
+
+    best=None
+    bestdelta=0
+    for j,value in moves:
+      delta=state.delta(j,value)
+      if delta<bestdelta:
+        best=(j,value)
+        bestdelta=delta
+    evals+=len(moves)
+
+    # If there's no improvement, then we've reached the top
+    if best!=None: state.move(*best)
+    if recorder!=None: recorder.record(step,state.cost)
+    step+=1
+    if best==None: break
+    if maxevals!=None and evals>=maxevals: break
+  return state.vec,state.cost,evals
 
-def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1):
+def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1,recorder=None):
+  if recorder!=None: costf=recorder.watch(costf)
   # Initialize the values randomly
-  vec=[float(random.randint(domain[i][0],domain[i][1])) 
+  vec=[float(random.randint(domain[i][0],domain[i][1]))
        for i in range(len(domain))]
-  
+  state=getstate(costf,vec)
+  ea=state.cost
+
   while T>0.1:
     # Choose one of the indices
     i=random.randint(0,len(domain)-1)
@@ -133,69 +526,241 @@ def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1):
     if vecb[i]<domain[i][0]: vecb[i]=domain[i][0]
     elif vecb[i]>domain[i][1]: vecb[i]=domain[i][1]
 
-    # Calculate the current cost and the new cost
-    ea=costf(vec)
-    eb=costf(vecb)
+    # Calculate the new cost, the current one is already known
+    eb=ea+state.delta(i,vecb[i])
     p=pow(math.e,(-eb-ea)/T)
 
     # Is it better, or does it make the probability
     # cutoff?
     if (eb<ea or random.random()<p):
-      vec=vecb      
+      state.move(i,vecb[i])
+      vec=vecb
+      ea=eb
+    if recorder!=None: recorder.record(len(recorder.rows),ea)
 
     # Decrease the temperature
     T=T*cool
   return vec
 
-def geneticoptimize(domain,costf,popsize=50,step=1,
-                    mutprod=0.2,elite=0.2,maxiter=100):
-  # Mutation Operation
-  def mutate(vec):
-    i=random.randint(0,len(domain)-1)
-    if random.random()<0.5 and vec[i]>domain[i][0]:
-      return vec[0:i]+[vec[i]-step]+vec[i+1:] 
-    elif vec[i]<domain[i][1]:
-      return vec[0:i]+[vec[i]+step]+vec[i+1:]
-  
-  # Crossover Operation
-  def crossover(r1,r2):
-    i=random.randint(1,len(domain)-2)
-    return r1[0:i]+r2[i:]
+# Mutation Operation
+def mutate(domain,vec,step=1):
+  i=random.randint(0,len(domain)-1)
+  if random.random()<0.5 and vec[i]>domain[i][0]:
+    return vec[0:i]+[vec[i]-step]+vec[i+1:]
+  elif vec[i]<domain[i][1]:
+    return vec[0:i]+[vec[i]+step]+vec[i+1:]
+  return vec
 
-  # Build the initial population
+# Crossover Operation
+def crossover(domain,r1,r2):
+  i=random.randint(1,len(domain)-2)
+  return r1[0:i]+r2[i:]
+
+def randompopulation(domain,popsize):
   pop=[]
   for i in range(popsize):
-    vec=[random.randint(domain[i][0],domain[i][1]) 
+    vec=[random.randint(domain[i][0],domain[i][1])
          for i in range(len(domain))]
     pop.append(vec)
-  
+  return pop
+
+# The next generation from a population ranked best first
+def breed(domain,ranked,popsize,topelite,step=1,mutprod=0.2):
+  # Start with the pure winners
+  pop=ranked[0:topelite]
+
+  # Add mutated and bred forms of the winners
+  while len(pop)<popsize:
+    if random.random()<mutprod:
+
+      # Mutation
+      c=random.randint(0,topelite)
+      pop.append(mutate(domain,ranked[c],step))
+    else:
+
+      # Crossover
+      c1=random.randint(0,topelite)
+      c2=random.randint(0,topelite)
+      pop.append(crossover(domain,ranked[c1],ranked[c2]))
+  return pop
+
+def geneticoptimize(domain,costf,popsize=50,step=1,
+                    mutprod=0.2,elite=0.2,maxiter=100,processes=1,recorder=None,
+                    verbose=True):
+  if recorder!=None: costf=recorder.watch(costf)
+  # Build the initial population
+  pop=randompopulation(domain,popsize)
+
   # How many winners from each generation?
   topelite=int(elite*popsize)
-  
-  # Main loop 
+
+  # Survivors and repeated children are only scored once
+  evaluator=populationevaluator(costf,processes)
+
+  # Main loop
   for i in range(maxiter):
-    scores=[(costf(v),v) for v in pop]
+    scores=zip(evaluator.costs(pop),pop)
     scores.sort()
     ranked=[v for (s,v) in scores]
-    
-    # Start with the pure winners
-    pop=ranked[0:topelite]
-    
-    # Add mutated and bred forms of the winners
-    while len(pop)<popsize:
-      if random.random()<mutprob:
-
-        # Mutation
-        c=random.randint(0,topelite)
-        pop.append(mutate(ranked[c]))
-      else:
-      
-        # Crossover
-        c1=random.randint(0,topelite)
-        c2=random.randint(0,topelite)
-        pop.append(crossover(ranked[c1],ranked[c2]))
-    
-    # Print current best score
-    print scores[0][0]
-    
+    pop=breed(domain,ranked,popsize,topelite,step,mutprod)
+    if recorder!=None: recorder.record(i,scores[0][0],evaluator.hits)
+
+    # Print current best score, and how fast new solutions were scored
+    if verbose:
+      print '%s\t%d new, %.0f evals/s, %.0f%% cached' % (
+        scores[0][0],evaluator.evals,evaluator.evals/max(evaluator.elapsed,0.000001),
+        100.0*evaluator.hits/len(scores))
+
+  evaluator.close()
   return scores[0][1]
+
+# One island of islandoptimize, run in its own process. Every
+# migrateevery generations it sends its best few solutions to the next
+# island and takes in the previous island's, which replace its worst.
+# Its trace has the best cost, how many costs were worked out and the
+# seconds since start for each generation.
+def runisland(index,domain,costf,seed,inbox,outbox,results,popsize,step,
+              mutprod,elite,maxiter,migrateevery,migrants,start):
+  random.seed(seed)
+  pop=randompopulation(domain,popsize)
+  topelite=int(elite*popsize)
+  evaluator=populationevaluator(costf)
+  trace=[]
+
+  for i in range(maxiter):
+    scores=zip(evaluator.costs(pop),pop)
+    scores.sort()
+    ranked=[v for (s,v) in scores]
+    trace.append((scores[0][0],evaluator.evals,time.time()-start))
+
+    if migrants>0 and migrateevery>0 and (i+1)%migrateevery==0 and i+1<maxiter:
+      outbox.put(ranked[0:migrants])
+      # Waiting for the neighbour keeps runs with the same seed the same
+      pop=ranked[0:len(ranked)-migrants]+inbox.get()
+      scores=zip(evaluator.costs(pop),pop)
+      scores.sort()
+      ranked=[v for (s,v) in scores]
+      # The migrants' costs count towards this generation
+      cost,evals,seconds=trace[-1]
+      trace[-1]=(cost,evals+evaluator.evals,seconds)
+
+    pop=breed(domain,ranked,popsize,topelite,step,mutprod)
+
+  results.put((index,scores[0][0],scores[0][1],trace))
+
+# geneticoptimize on several populations at once, one process each,
+# arranged in a ring that passes elites along. Island i is seeded with
+# seed+i. Returns the best solution found on any island and, for every
+# island, the best cost in each generation. The islands' costs can't be
+# watched from here, so a recorder gets a row for each generation once
+# they have finished, with the best cost and the costs worked out on
+# any island.
+def islandoptimize(domain,costf,islands=4,seed=0,migrateevery=10,migrants=2,
+                   popsize=50,step=1,mutprod=0.2,elite=0.2,maxiter=100,
+                   recorder=None):
+  if recorder!=None: recorder.begin()
+  start=time.time()
+  inboxes=[Queue() for i in range(islands)]
+  results=Queue()
+  procs=[Process(target=runisland,
+                 args=(i,domain,costf,seed+i,inboxes[i],inboxes[(i+1)%islands],
+                       results,popsize,step,mutprod,elite,maxiter,
+                       migrateevery,migrants,start))
+         for i in range(islands)]
+  for p in procs: p.start()
+
+  # Read the results before joining, a process with queued data
+  # doesn't exit until it has been read
+  finished=[results.get() for p in procs]
+  for p in procs: p.join()
+
+  finished.sort()
+  traces=[trace for (index,cost,vec,trace) in finished]
+  if recorder!=None:
+    for i in range(maxiter):
+      rows=[trace[i] for trace in traces]
+      recorder.record(i,min([row[0] for row in rows]),
+                      evals=sum([row[1] for row in rows]),
+                      seconds=max([row[2] for row in rows]))
+  best=min([(cost,vec) for (index,cost,vec,trace) in finished])
+  return best[1],[[row[0] for row in trace] for trace in traces]
+
+# steps moves of an annealing chain held at temperature T, run in the
+# pool. Returns the chain's new state, the best solution it passed
+# through and how many costs it worked out.
+def temperingsteps(task):
+  domain,vec,cost,T,steps,step,seed=task
+  random.seed(seed)
+  state=getstate(poolcostf,vec)
+  cost=state.cost
+  evals=1
+  best=(cost,vec)
+
+  for n in range(steps):
+    i=random.randint(0,len(domain)-1)
+    vecb=vec[:]
+    vecb[i]+=random.randint(-step,step)
+    if vecb[i]<domain[i][0]: vecb[i]=domain[i][0]
+    elif vecb[i]>domain[i][1]: vecb[i]=domain[i][1]
+
+    eb=cost+state.delta(i,vecb[i])
+    evals+=1
+    if eb<cost or random.random()<math.exp(-(eb-cost)/T):
+      state.move(i,vecb[i])
+      vec,cost=vecb,eb
+      if cost<best[0]: best=(cost,vec)
+  return vec,cost,best,evals
+
+# A hill climb from a random start, run in the pool
+def climbsteps(task):
+  domain,maxevals,seed=task
+  random.seed(seed)
+  sol=[random.randint(domain[i][0],domain[i][1]) for i in range(len(domain))]
+  sol,cost,evals=climb(domain,poolcostf,sol,maxevals)
+  return sol,cost,(cost,sol),evals
+
+# Runs a portfolio of optimizers in a pool of processes until maxevals
+# costs have been worked out or maxtime seconds have passed, and returns
+# the best solution any of them found.
+#
+# chains annealing chains are held at temperatures spread from Tmin to
+# Tmax. After every round of steps moves, neighbouring chains may swap
+# solutions (replica exchange), so good solutions found by the hot
+# chains drift down to the cold ones. Each round also does restarts
+# hill climbs from random starts.
+def portfoliooptimize(domain,costf,chains=8,Tmin=1.0,Tmax=10000.0,steps=100,
+                      restarts=2,step=1,maxevals=100000,maxtime=None,
+                      processes=None,seed=0,recorder=None):
+  if recorder!=None: recorder.begin()
+  rand=random.Random(seed)
+  pool=startpool(costf,processes)
+  temps=[Tmin*(Tmax/Tmin)**(float(k)/max(1,chains-1)) for k in range(chains)]
+  state=[([float(rand.randint(domain[i][0],domain[i][1]))
+           for i in range(len(domain))],None) for k in range(chains)]
+  best=None
+  evals=0
+  start=time.time()
+  round=0
+
+  while evals<maxevals and (maxtime==None or time.time()-start<maxtime):
+    tasks=[(domain,state[k][0],state[k][1],temps[k],steps,step,
+            rand.randint(0,2**30)) for k in range(chains)]
+    climbs=[(domain,steps,rand.randint(0,2**30)) for k in range(restarts)]
+    results=poolmap(pool,temperingsteps,tasks)+poolmap(pool,climbsteps,climbs)
+
+    for vec,cost,found,n in results:
+      evals+=n
+      if best==None or found[0]<best[0]: best=found
+    if recorder!=None: recorder.record(round,best[0],evals=sum([r[3] for r in results]))
+    state=[(vec,cost) for (vec,cost,found,n) in results[0:chains]]
+
+    # Swap neighbouring chains with the Metropolis probability,
+    # alternating which pairs are tried
+    for k in range(round%2,chains-1,2):
+      delta=(1.0/temps[k]-1.0/temps[k+1])*(state[k][1]-state[k+1][1])
+      if delta>=0 or rand.random()<math.exp(delta):
+        state[k],state[k+1]=state[k+1],state[k]
+    round+=1
+
+  stoppool(pool)
+  return best[1]
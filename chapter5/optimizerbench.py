@@ -0,0 +1,203 @@
+# Runs every optimizer on the cost functions in this chapter and on
+# made up landscapes of growing size, several times each with fixed
+# seeds, and prints a table of how good the solutions were and how many
+# evaluations and seconds it took to get close to the best cost.
+#
+#   python optimizerbench.py [runs] [csv file]
+#
+# "Close" is measured on the gap between a typical random solution and
+# the best cost, which is the optimum where it is known and otherwise
+# the best any run found. A run reaches 90% once its best cost has
+# closed 90% of that gap, and 99% likewise. The tables give how many
+# runs got there and the median evaluations and seconds they took.
+
+import os
+import sys
+import csv
+import imp
+import math
+import time
+import random
+import numpy as np
+import optimization
+import dorm
+import socialnetwork
+
+# The particle swarm optimizer is in chapter 8
+swarm=imp.load_source('swarm',os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           '..','chapter8','optimization.py'))
+
+# A problem to benchmark on. optimum is None when it isn't known.
+class problem:
+  def __init__(self,name,domain,costf,optimum=None):
+    self.name=name
+    self.domain=domain
+    self.costf=costf
+    self.optimum=optimum
+
+# Rastrigin's function, lots of local minima on a bowl, over the
+# integers 0-100 for x from -5 to 5. Its minimum is 0 at 50,50,...
+def rastrigin(n):
+  def costf(v):
+    x=(np.asarray(v,dtype=float)-50)*0.1
+    return float(10*n+(x*x-10*np.cos(2*math.pi*x)).sum())
+  return problem('rastrigin',[(0,100)]*n,costf,0.0)
+
+# Rosenbrock's function, a long curved valley, for x from -2.5 to 2.5.
+# Its minimum is 0 at 70,70,...
+def rosenbrock(n):
+  def costf(v):
+    x=(np.asarray(v,dtype=float)-50)*0.05
+    return float((100*(x[1:]-x[:-1]**2)**2+(1-x[:-1])**2).sum())
+  return problem('rosenbrock',[(0,100)]*n,costf,0.0)
+
+# A random quadratic assignment problem: n facilities with flows
+# between them to put at n random places, paying flow times distance.
+# A solution picks each facility's place from the ones left, like
+# dormcost picks slots.
+def qap(n,seed=0):
+  r=np.random.RandomState(seed)
+  flows=r.randint(0,10,(n,n))
+  flows=np.triu(flows,1)+np.triu(flows,1).T
+  places=r.uniform(0,100,(n,2))
+  distances=np.sqrt(((places[:,None,:]-places[None,:,:])**2).sum(axis=2))
+  def costf(v):
+    slots=range(n)
+    p=[slots.pop(int(x)) for x in v]
+    return float((flows*distances[np.ix_(p,p)]).sum()/2)
+  return problem('qap',[(0,n-1-i) for i in range(n)],costf)
+
+def problems(dims=(5,10,20)):
+  found=[problem('schedule',[(0,9)]*(len(optimization.people)*2),
+                 optimization.schedulecost),
+         problem('dorm',dorm.domain,dorm.dormcost,
+                 dorm.dormcost(dorm.optimalsolution())),
+         problem('crosscount',socialnetwork.domain,socialnetwork.crosscount)]
+  for make in [rastrigin,rosenbrock,qap]:
+    for n in dims: found.append(make(n))
+  return found
+
+def optimizers():
+  return [('random',lambda d,c,rec,seed: optimization.randomoptimize(d,c,recorder=rec)),
+          ('hillclimb',lambda d,c,rec,seed: optimization.hillclimb(d,c,recorder=rec)),
+          ('annealing',lambda d,c,rec,seed: optimization.annealingoptimize(d,c,recorder=rec)),
+          ('genetic',lambda d,c,rec,seed: optimization.geneticoptimize(d,c,recorder=rec,
+                                                                        verbose=False)),
+          ('swarm',lambda d,c,rec,seed: swarm.swarmoptimize(d,c,recorder=rec,verbose=False)),
+          ('portfolio',lambda d,c,rec,seed: optimization.portfoliooptimize(
+            d,c,maxevals=20000,processes=1,seed=seed,recorder=rec)),
+          ('islands',lambda d,c,rec,seed: optimization.islandoptimize(
+            d,c,seed=seed,recorder=rec)[0])]
+
+# The median cost of random solutions, the far end of the gap
+def typicalcost(prob,samples=200,seed=0):
+  r=random.Random(seed)
+  costs=[prob.costf([r.randint(low,high) for (low,high) in prob.domain])
+         for i in range(samples)]
+  return median(costs)
+
+def median(values):
+  values=sorted(values)
+  if len(values)==0: return None
+  return values[len(values)/2]
+
+# The evaluations and seconds a run took to get down to target, or None
+def reached(rec,target):
+  if rec==None: return None
+  for row in rec.rows:
+    if row[2]<=target: return row[3],row[5]
+  return None
+
+# Runs each optimizer on prob runs times, seeded 0 to runs-1. Returns
+# a list of (optimizer,seed,final cost,seconds,recorder) for each run.
+def benchmark(prob,runs=5):
+  results=[]
+  for name,optimize in optimizers():
+    for seed in range(runs):
+      random.seed(seed)
+      np.random.seed(seed)
+      rec=optimization.recorder(name)
+      start=time.time()
+      sol=optimize(prob.domain,prob.costf,rec,seed)
+      elapsed=time.time()-start
+      results.append((name,seed,prob.costf(sol),elapsed,rec))
+  return results
+
+# One row of the table for each optimizer on prob
+def summarize(prob,results,fractions=(0.9,0.99)):
+  reference=prob.optimum
+  if reference==None: reference=min([cost for (name,seed,cost,elapsed,rec) in results])
+  typical=typicalcost(prob)
+  targets=[typical-f*(typical-reference) for f in fractions]
+
+  rows=[]
+  names=[]
+  for name,seed,cost,elapsed,rec in results:
+    if name not in names: names.append(name)
+  for name in names:
+    runs=[r for r in results if r[0]==name]
+    row=[prob.name,len(prob.domain),name,
+         float(sum([r[2] for r in runs]))/len(runs),min([r[2] for r in runs]),
+         median([r[3] for r in runs])]
+    if runs[0][4]==None: row.append(None)
+    else: row.append(median([r[4].evals for r in runs]))
+    for target in targets:
+      if runs[0][4]==None:
+        row+=[None,len(runs),None,None]
+        continue
+      hits=[h for h in [reached(r[4],target) for r in runs] if h!=None]
+      row+=[len(hits),len(runs),median([h[0] for h in hits]),median([h[1] for h in hits])]
+    rows.append(row)
+  return reference,rows
+
+def showcount(x):
+  if x==None: return '-'
+  return '%d' % x
+
+def showtime(x):
+  if x==None: return '-'
+  return '%.3f' % x
+
+def printtable(rows,fractions=(0.9,0.99)):
+  header='%-10s %4s %-10s %10s %10s %8s %7s' % ('problem','dims','optimizer',
+                                                 'mean','best','seconds','evals')
+  for f in fractions:
+    header+=' | %6s %7s %7s' % ('to%g%%' % (f*100),'evals','seconds')
+  print header
+  for row in rows:
+    line='%-10s %4d %-10s %10.2f %10.2f %8.3f %7s' % (row[0],row[1],row[2],row[3],row[4],
+                                                      row[5],showcount(row[6]))
+    for k in range(len(fractions)):
+      hits,runs,evals,seconds=row[7+4*k:11+4*k]
+      if hits!=None: hits='%d/%d' % (hits,runs)
+      else: hits='-'
+      line+=' | %6s %7s %7s' % (hits,showcount(evals),showtime(seconds))
+    print line
+
+def run(runs=5,dims=(5,10,20),csvpath=None,fractions=(0.9,0.99)):
+  table=[]
+  for prob in problems(dims):
+    results=benchmark(prob,runs)
+    reference,rows=summarize(prob,results,fractions)
+    print '%s, %d dims, best cost %.2f' % (prob.name,len(prob.domain),reference)
+    printtable(rows,fractions)
+    print
+    table+=rows
+
+  if csvpath!=None:
+    out=open(csvpath,'wb')
+    writer=csv.writer(out)
+    fields=['problem','dims','optimizer','mean','best','seconds','evals']
+    for f in fractions:
+      fields+=['%g%% %s' % (f*100,field) for field in ['hits','runs','evals','seconds']]
+    writer.writerow(fields)
+    writer.writerows(table)
+    out.close()
+  return table
+
+if __name__=='__main__':
+  runs=5
+  if len(sys.argv)>1: runs=int(sys.argv[1])
+  csvpath=None
+  if len(sys.argv)>2: csvpath=sys.argv[2]
+  run(runs,csvpath=csvpath)
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 people=['Charlie','Augustus','Veruca','Violet','Mike','Joe','Willy','Miranda']
 
@@ -16,50 +17,179 @@ links=[('Augustus', 'Willy'),
        ('Miranda', 'Joe')]
 
 
+# For a number of ranges [starts[i],ends[i]), the range each position
+# came from and the position itself, without a loop in Python
+def expandranges(starts,ends):
+  counts=np.maximum(ends-starts,0)
+  owners=np.repeat(np.arange(len(counts)),counts)
+  firsts=np.repeat(np.cumsum(counts)-counts,counts)
+  return owners,np.arange(counts.sum())-firsts+np.repeat(starts,counts)
+
+# The cost of a layout of any graph: how many links cross, plus a
+# penalty for nodes closer than mindist, weighted by closeweight.
+# Candidate pairs come from a uniform grid, so layouts where links are
+# short compared to the whole drawing don't test every pair. Small
+# graphs just test every pair at once.
+class layoutcost:
+  def __init__(self,people,links,mindist=50.0,closeweight=1.0,smallgraph=64):
+    index=dict([(people[i],i) for i in range(len(people))])
+    self.nodes=len(people)
+    self.ends=np.array([(index[a],index[b]) for (a,b) in links],dtype=int).reshape(-1,2)
+    self.mindist=mindist
+    self.closeweight=closeweight
+    self.smallgraph=smallgraph
+
+  def __call__(self,v):
+    xy=np.asarray(v,dtype=float).reshape(-1,2)
+    return self.crossings(xy)+self.closeweight*self.closeness(xy)
+
+  # Pairs (i,j), i<j, of links that might cross
+  def linkpairs(self,p1,p2):
+    nlinks=len(p1)
+    if nlinks<=self.smallgraph:
+      return np.triu_indices(nlinks,1)
+
+    # Cells about the size of an average link, put every link in each
+    # cell its bounding box touches. Links that cross share the cell
+    # their crossing is in.
+    low=np.minimum(p1,p2)
+    high=np.maximum(p1,p2)
+    cellsize=max(np.sqrt(((p2-p1)**2).sum(axis=1)).mean(),1.0)
+    origin=low.min(axis=0)
+    cmin=((low-origin)/cellsize).astype(int)
+    cmax=((high-origin)/cellsize).astype(int)
+    width=cmax-cmin+1
+    # Very long links touch too many cells to be worth it
+    if (width[:,0]*width[:,1]).sum()>nlinks*nlinks/2:
+      return np.triu_indices(nlinks,1)
+
+    links,cell=expandranges(np.zeros(nlinks,dtype=int),width[:,0]*width[:,1])
+    cx=cmin[links,0]+cell%width[links,0]
+    cy=cmin[links,1]+cell/width[links,0]
+    keys=cx*(cmax[:,1].max()+1)+cy
+    order=np.argsort(keys,kind='mergesort')
+    keys,links=keys[order],links[order]
+
+    # Every later entry in the same cell is a partner
+    groupends=np.searchsorted(keys,keys,side='right')
+    first,second=expandranges(np.arange(len(keys))+1,groupends)
+    a,b=links[first],links[second]
+    pairs=np.unique(np.minimum(a,b)*nlinks+np.maximum(a,b))
+    return pairs/nlinks,pairs%nlinks
+
+  def crossings(self,xy):
+    if len(self.ends)<2: return 0
+    p1,p2=xy[self.ends[:,0]],xy[self.ends[:,1]]
+    i,j=self.linkpairs(p1,p2)
+    (x1,y1),(x2,y2)=p1[i].T,p2[i].T
+    (x3,y3),(x4,y4)=p1[j].T,p2[j].T
+
+    den=(y4-y3)*(x2-x1)-(x4-x3)*(y2-y1)
+    # den==0 if the lines are parallel
+    parallel=den==0
+    den[parallel]=1.0
+    ua=((x4-x3)*(y1-y3)-(y4-y3)*(x1-x3))/den
+    ub=((x2-x1)*(y1-y3)-(y2-y1)*(x1-x3))/den
+    return int(((ua>0)&(ua<1)&(ub>0)&(ub<1)&~parallel).sum())
+
+  def closeness(self,xy):
+    # With cells mindist across, close nodes are in the same or
+    # neighbouring cells. Each pair of cells is looked at once.
+    cells=np.floor((xy-xy.min(axis=0))/self.mindist).astype(int)
+    height=cells[:,1].max()+3
+    keys=cells[:,0]*height+cells[:,1]+1
+    order=np.argsort(keys,kind='mergesort')
+    keys=keys[order]
+
+    first=[]
+    second=[]
+    n=len(keys)
+    for offset in [0,height-1,height,height+1,1]:
+      starts=np.searchsorted(keys,keys+offset,side='left')
+      if offset==0: starts=np.arange(n)+1
+      ends=np.searchsorted(keys,keys+offset,side='right')
+      a,b=expandranges(starts,ends)
+      first.append(a)
+      second.append(b)
+    a=order[np.concatenate(first)]
+    b=order[np.concatenate(second)]
+
+    dist=np.sqrt(((xy[a]-xy[b])**2).sum(axis=1))
+    close=dist<self.mindist
+    return (1.0-dist[close]/self.mindist).sum()
+
+# crosscount has always added the closeness penalties once for every
+# link
+network=layoutcost(people,links,closeweight=len(links))
+
 def crosscount(v):
-  # Convert the number list into a dictionary of person:(x,y)
-  loc=dict([(people[i],(v[i*2],v[i*2+1])) for i in range(0,len(people))])
-  total=0
-  
-  # Loop through every pair of links
-  for i in range(len(links)):
-    for j in range(i+1,len(links)):
-
-      # Get the locations 
-      (x1,y1),(x2,y2)=loc[links[i][0]],loc[links[i][1]]
-      (x3,y3),(x4,y4)=loc[links[j][0]],loc[links[j][1]]
-      
-      den=(y4-y3)*(x2-x1)-(x4-x3)*(y2-y1)
-
-      # den==0 if the lines are parallel
-      if den==0: continue
-
-      # Otherwise ua and ub are the fraction of the
-      # line where they cross
-      ua=((x4-x3)*(y1-y3)-(y4-y3)*(x1-x3))/den
-      ub=((x2-x1)*(y1-y3)-(y2-y1)*(x1-x3))/den
-      
-      # If the fraction is between 0 and 1 for both lines
-      # then they cross each other
-      if ua>0 and ua<1 and ub>0 and ub<1:
-        total+=1
-    for i in range(len(people)):
-      for j in range(i+1,len(people)):
-        # Get the locations of the two nodes
-        (x1,y1),(x2,y2)=loc[people[i]],loc[people[j]]
-
-        # Find the distance between them
-        dist=math.sqrt(math.pow(x1-x2,2)+math.pow(y1-y2,2))
-        # Penalize any nodes closer than 50 pixels
-        if dist<50:
-          total+=(1.0-(dist/50.0))
-        
-  return total
+  return network(v)
+
+# Whether the line from p1 to p2 crosses the one from p3 to p4, worked
+# out the same way as in crosscount
+def crosses((x1,y1),(x2,y2),(x3,y3),(x4,y4)):
+  den=(y4-y3)*(x2-x1)-(x4-x3)*(y2-y1)
+  if den==0: return 0
+  ua=float((x4-x3)*(y1-y3)-(y4-y3)*(x1-x3))/den
+  ub=float((x2-x1)*(y1-y3)-(y2-y1)*(x1-x3))/den
+  if ua>0 and ua<1 and ub>0 and ub<1: return 1
+  return 0
+
+# The penalty for two nodes being closer than 50 pixels
+def closeness((x1,y1),(x2,y2)):
+  dist=math.sqrt(math.pow(x1-x2,2)+math.pow(y1-y2,2))
+  if dist<50: return 1.0-(dist/50.0)
+  return 0
+
+# crosscount for one layout that is changed a coordinate at a time.
+# Moving a node only changes the crossings of its own links and how
+# close it is to the other nodes. crosscount adds the closeness
+# penalties once for every link, so they are counted that many times
+# here too.
+class crossstate:
+  def __init__(self,v):
+    self.vec=list(v)
+    self.cost=crosscount(v)
+    index=dict([(people[i],i) for i in range(len(people))])
+    self.ends=[(index[a],index[b]) for (a,b) in links]
+    self.incident=[[k for k in range(len(links)) if i in self.ends[k]]
+                   for i in range(len(people))]
+
+  # The crossings and closeness that involve node, with it at loc
+  def nodecost(self,node,loc):
+    locs=[(self.vec[i*2],self.vec[i*2+1]) for i in range(len(people))]
+    locs[node]=loc
+    mine=self.incident[node]
+    total=0
+    for a in mine:
+      for b in range(len(links)):
+        # Pairs of this node's own links are only counted once
+        if b==a or (b in mine and b<a): continue
+        i,j=min(a,b),max(a,b)
+        total+=crosses(locs[self.ends[i][0]],locs[self.ends[i][1]],
+                       locs[self.ends[j][0]],locs[self.ends[j][1]])
+    for other in range(len(people)):
+      if other!=node: total+=len(links)*closeness(loc,locs[other])
+    return total
+
+  def delta(self,k,value):
+    node=k/2
+    old=(self.vec[node*2],self.vec[node*2+1])
+    new=list(old)
+    new[k%2]=value
+    return self.nodecost(node,tuple(new))-self.nodecost(node,old)
+
+  def move(self,k,value):
+    self.cost+=self.delta(k,value)
+    self.vec[k]=value
+
+crosscount.incremental=crossstate
 from PIL import Image,ImageDraw
 
-def drawnetwork(sol):
+# Draws any graph, this one unless people and links are given
+def drawnetwork(sol,people=people,links=links,size=400):
   # Create the image
-  img=Image.new('RGB',(400,400),(255,255,255))
+  img=Image.new('RGB',(size,size),(255,255,255))
   draw=ImageDraw.Draw(img)
 
   # Create the position dict
@@ -1,6 +1,10 @@
 from pysqlite2 import dbapi2 as sqlite
 import re
 import math
+import time
+from collections import Counter
+from itertools import islice,imap
+from multiprocessing import Pool
 
 def getwords(doc):
   splitter=re.compile('\\W*')
@@ -12,59 +16,227 @@ def getwords(doc):
   # Return the unique set of words only
   return dict([(w,1) for w in words])
 
-class classifier:
-  def __init__(self,getfeatures,filename=None):
-    # Counts of feature/category combinations
+# Where a classifier keeps its counts. Both stores have the same
+# methods, and fcounts(f) gives the counts of a feature in every
+# category at once. memorystore keeps everything in dicts.
+class memorystore:
+  def __init__(self):
+    # Counts of feature/category combinations, by feature
     self.fc={}
     # Counts of documents in each category
     self.cc={}
+    self.total=0
+    # How many documents of each trainmany run have been counted
+    self.checkpoints={}
+
+  def incf(self,f,cat,n=1):
+    counts=self.fc.setdefault(f,{})
+    counts[cat]=counts.get(cat,0)+n
+
+  def fcount(self,f,cat):
+    return float(self.fcounts(f).get(cat,0))
+
+  def fcounts(self,f):
+    return self.fc.get(f,{})
+
+  def incc(self,cat,n=1):
+    self.cc[cat]=self.cc.get(cat,0)+n
+    self.total+=n
+
+  def catcount(self,cat):
+    return float(self.cc.get(cat,0))
+
+  def categories(self):
+    return self.cc.keys()
+
+  def totalcount(self):
+    return self.total
+
+  # Adds {(feature,category):count} and {category:count}, and records
+  # that done documents of the run named checkpoint are in
+  def addcounts(self,fc,cc,checkpoint=None,done=0):
+    for (f,cat),n in fc.items(): self.incf(f,cat,n)
+    for cat,n in cc.items(): self.incc(cat,n)
+    if checkpoint!=None: self.checkpoints[checkpoint]=done
+
+  def getcheckpoint(self,checkpoint):
+    return self.checkpoints.get(checkpoint,0)
+
+  def flush(self):
+    pass
+
+# Keeps the counts in an SQLite database, writing changes behind. The
+# category counts are read once and kept, feature counts are kept once
+# they have been read (up to cachesize features), and changes are
+# written together in one transaction every flushevery documents, or
+# on flush(). Call flush() or close() when done training so the last
+# ones are saved; whatever is left is also written when the store is
+# garbage collected.
+class sqlitestore:
+  def __init__(self,dbfile,flushevery=1000,cachesize=100000):
+    self.con=sqlite.connect(dbfile)
+    self.con.execute('create table if not exists fc(feature,category,count)')
+    self.con.execute('create table if not exists cc(category,count)')
+    self.con.execute('create unique index if not exists fcindex on fc(feature,category)')
+    self.con.execute('create unique index if not exists ccindex on cc(category)')
+    self.con.execute('create table if not exists checkpoints(name primary key,done)')
+    self.con.commit()
+    self.flushevery=flushevery
+    self.cachesize=cachesize
+
+    self.cc=dict(self.con.execute('select category,count from cc'))
+    self.total=sum(self.cc.values())
+    # Feature counts that have been read, with the changes since
+    self.fc={}
+    # Changes not yet written, and how many documents they are from
+    self.fcdelta={}
+    self.ccdelta={}
+    self.pending=0
+
+  def incf(self,f,cat,n=1):
+    delta=self.fcdelta.setdefault(f,{})
+    delta[cat]=delta.get(cat,0)+n
+    if f in self.fc: self.fc[f][cat]=self.fc[f].get(cat,0)+n
+
+  def fcount(self,f,cat):
+    return float(self.fcounts(f).get(cat,0))
+
+  def fcounts(self,f):
+    if f not in self.fc:
+      if len(self.fc)>=self.cachesize: self.fc.clear()
+      counts=dict(self.con.execute(
+        'select category,count from fc where feature=?',(f,)))
+      for cat,n in self.fcdelta.get(f,{}).items():
+        counts[cat]=counts.get(cat,0)+n
+      self.fc[f]=counts
+    return self.fc[f]
+
+  # Each document's category is counted last, so this is where a
+  # document is done
+  def incc(self,cat,n=1):
+    self.addcc(cat,n)
+    self.pending+=1
+    if self.pending>=self.flushevery: self.flush()
+
+  def addcc(self,cat,n):
+    self.cc[cat]=self.cc.get(cat,0)+n
+    self.ccdelta[cat]=self.ccdelta.get(cat,0)+n
+    self.total+=n
+
+  def catcount(self,cat):
+    return float(self.cc.get(cat,0))
+
+  def categories(self):
+    return self.cc.keys()
+
+  def totalcount(self):
+    return self.total
+
+  # As memorystore.addcounts. The counts and the checkpoint are written
+  # in the same transaction, so a run that stops can carry on from the
+  # checkpoint without counting anything twice.
+  def addcounts(self,fc,cc,checkpoint=None,done=0):
+    for (f,cat),n in fc.items(): self.incf(f,cat,n)
+    for cat,n in cc.items(): self.addcc(cat,n)
+    self.flush(checkpoint,done)
+
+  def getcheckpoint(self,checkpoint):
+    res=self.con.execute('select done from checkpoints where name=?',
+                         (checkpoint,)).fetchone()
+    if res==None: return 0
+    return res[0]
+
+  def flush(self,checkpoint=None,done=0):
+    fc=[(n,f,cat) for (f,counts) in self.fcdelta.items()
+        for (cat,n) in counts.items()]
+    self.con.executemany('insert or ignore into fc values (?,?,0)',
+                         [(f,cat) for (n,f,cat) in fc])
+    self.con.executemany(
+      'update fc set count=count+? where feature=? and category=?',fc)
+    cc=[(n,cat) for (cat,n) in self.ccdelta.items()]
+    self.con.executemany('insert or ignore into cc values (?,0)',
+                         [(cat,) for (n,cat) in cc])
+    self.con.executemany('update cc set count=count+? where category=?',cc)
+    if checkpoint!=None:
+      self.con.execute('insert or replace into checkpoints values (?,?)',
+                       (checkpoint,done))
+    self.con.commit()
+    self.fcdelta={}
+    self.ccdelta={}
+    self.pending=0
+
+  def close(self):
+    self.flush()
+    self.con.close()
+
+  def __del__(self):
+    # Nothing to do if __init__ didn't finish or the store was closed
+    if len(getattr(self,'fcdelta',{}))>0 or len(getattr(self,'ccdelta',{}))>0:
+      self.flush()
+
+# The features function the pool's workers use. It is set before the
+# pool is started and the workers inherit it, so getfeatures doesn't
+# have to be picklable.
+poolfeatures=None
+
+# Counts of {(feature,category):count} and {category:count} for a
+# chunk of (item,category) pairs
+def countfeatures(pairs):
+  fc=Counter()
+  cc=Counter()
+  for item,cat in pairs:
+    for f in poolfeatures(item): fc[(f,cat)]+=1
+    cc[cat]+=1
+  return fc,cc
+
+# A pool whose workers use getfeatures, or None to work in this process
+def startpool(getfeatures,processes):
+  global poolfeatures
+  poolfeatures=getfeatures
+  if processes==1: return None
+  return Pool(processes)
+
+def stoppool(pool):
+  if pool!=None:
+    pool.close()
+    pool.join()
+
+class classifier:
+  def __init__(self,getfeatures,filename=None):
+    # Counts of feature/category combinations and of documents in
+    # each category
+    self.store=memorystore()
     self.getfeatures=getfeatures
     
   def setdb(self,dbfile):
-    self.con=sqlite.connect(dbfile)    
-    self.con.execute('create table if not exists fc(feature,category,count)')
-    self.con.execute('create table if not exists cc(category,count)')
+    self.setstore(sqlitestore(dbfile))
 
+  def setstore(self,store):
+    # Don't lose what the old store hasn't written yet
+    self.store.flush()
+    self.store=store
+
+  # Save any counts the store hasn't written yet
+  def flush(self):
+    self.store.flush()
 
   def incf(self,f,cat):
-    count=self.fcount(f,cat)
-    if count==0:
-      self.con.execute("insert into fc values ('%s','%s',1)" 
-                       % (f,cat))
-    else:
-      self.con.execute(
-        "update fc set count=%d where feature='%s' and category='%s'" 
-        % (count+1,f,cat)) 
+    self.store.incf(f,cat)
   
   def fcount(self,f,cat):
-    res=self.con.execute(
-      'select count from fc where feature="%s" and category="%s"'
-      %(f,cat)).fetchone()
-    if res==None: return 0
-    else: return float(res[0])
+    return self.store.fcount(f,cat)
 
   def incc(self,cat):
-    count=self.catcount(cat)
-    if count==0:
-      self.con.execute("insert into cc values ('%s',1)" % (cat))
-    else:
-      self.con.execute("update cc set count=%d where category='%s'" 
-                       % (count+1,cat))    
+    self.store.incc(cat)
 
   def catcount(self,cat):
-    res=self.con.execute('select count from cc where category="%s"'
-                         %(cat)).fetchone()
-    if res==None: return 0
-    else: return float(res[0])
+    return self.store.catcount(cat)
 
   def categories(self):
-    cur=self.con.execute('select category from cc');
-    return [d[0] for d in cur]
+    return self.store.categories()
 
   def totalcount(self):
-    res=self.con.execute('select sum(count) from cc').fetchone();
-    if res==None: return 0
-    return res[0]
+    return self.store.totalcount()
 
 
   def train(self,item,cat):
@@ -75,7 +247,47 @@ class classifier:
 
     # Increment the count for this category
     self.incc(cat)
-    self.con.commit()
+
+  # Trains on an iterator of (item,category) pairs. Features are found
+  # in a pool of processes (None for one per CPU, 1 to work in this
+  # one), chunksize items at a time, and counted there. Every batchsize
+  # items the counts go into the store together. With a checkpoint name
+  # the store remembers how far the run got, and running it again with
+  # the same items and name skips the ones already trained on. With
+  # verbose it prints how fast it is going after each batch. Returns
+  # how many items it trained on.
+  def trainmany(self,pairs,processes=None,batchsize=10000,chunksize=100,
+                checkpoint=None,verbose=True):
+    pairs=iter(pairs)
+    done=0
+    if checkpoint!=None:
+      done=self.store.getcheckpoint(checkpoint)
+      for pair in islice(pairs,done): pass
+
+    pool=startpool(self.getfeatures,processes)
+    trained=0
+    start=time.time()
+    try:
+      while 1:
+        batch=list(islice(pairs,batchsize))
+        if len(batch)==0: break
+        chunks=[batch[i:i+chunksize] for i in range(0,len(batch),chunksize)]
+        if pool==None: counted=imap(countfeatures,chunks)
+        else: counted=pool.imap_unordered(countfeatures,chunks)
+
+        fc=Counter()
+        cc=Counter()
+        for chunkfc,chunkcc in counted:
+          fc.update(chunkfc)
+          cc.update(chunkcc)
+        done+=len(batch)
+        trained+=len(batch)
+        self.store.addcounts(fc,cc,checkpoint,done)
+        if verbose:
+          print '%d items, %.0f items/s' % (trained,trained/max(time.time()-start,0.000001))
+    finally:
+      stoppool(pool)
+    return trained
 
   def fprob(self,f,cat):
     if self.catcount(cat)==0: return 0
@@ -90,7 +302,7 @@ class classifier:
 
     # Count the number of times this feature has appeared in
     # all categories
-    totals=sum([self.fcount(f,c) for c in self.categories()])
+    totals=sum(self.store.fcounts(f).values())
 
     # Calculate the weighted average
     bp=((weight*ap)+(totals*basicprob))/(weight+totals)
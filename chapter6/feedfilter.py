@@ -5,25 +5,29 @@ import re
 def read(feed,classifier):
   # Get feed entries and loop over them
   f=feedparser.parse(feed)
-  for entry in f['entries']:
-    print
-    print '-----'
-    # Print the contents of the entry
-    print 'Title:     '+entry['title'].encode('utf-8')
-    print 'Publisher: '+entry['publisher'].encode('utf-8')
-    print
-    print entry['summary'].encode('utf-8')
-    
+  try:
+    for entry in f['entries']:
+      print
+      print '-----'
+      # Print the contents of the entry
+      print 'Title:     '+entry['title'].encode('utf-8')
+      print 'Publisher: '+entry['publisher'].encode('utf-8')
+      print
+      print entry['summary'].encode('utf-8')
+      
 
-    # Combine all the text to create one item for the classifier
-    fulltext='%s\n%s\n%s' % (entry['title'],entry['publisher'],entry['summary'])
+      # Combine all the text to create one item for the classifier
+      fulltext='%s\n%s\n%s' % (entry['title'],entry['publisher'],entry['summary'])
 
-    # Print the best guess at the current category
-    print 'Guess: '+str(classifier.classify(entry))
+      # Print the best guess at the current category
+      print 'Guess: '+str(classifier.classify(entry))
 
-    # Ask the user to specify the correct category and train on that
-    cl=raw_input('Enter category: ')
-    classifier.train(entry,cl)
+      # Ask the user to specify the correct category and train on that
+      cl=raw_input('Enter category: ')
+      classifier.train(entry,cl)
+  finally:
+    # Save what was trained, even if reading stopped part way
+    classifier.flush()
 
 
 def entryfeatures(entry):
@@ -0,0 +1,68 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import docclass
+
+# Made-up documents from a small vocabulary, each with a category
+def makedocs(n=60,seed=0):
+  random.seed(seed)
+  words=['quick','rabbit','money','casino','water','fences','online','fox',
+         'pharmaceuticals','jumps','brown','owns']
+  return [(' '.join([random.choice(words) for i in range(random.randint(1,8))]),
+           random.choice(['good','bad']))
+          for j in range(n)]
+
+class stopped(Exception): pass
+
+# The pairs, stopping with an exception after the first n
+def interrupted(pairs,n):
+  for i in range(len(pairs)):
+    if i==n: raise stopped()
+    yield pairs[i]
+
+class trainmanytest(unittest.TestCase):
+  def setUp(self):
+    self.dir=tempfile.mkdtemp()
+    self.docs=makedocs()
+    self.expected=docclass.classifier(docclass.getwords)
+    for item,cat in self.docs: self.expected.train(item,cat)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  # Every feature and category is counted as train counts them
+  def assertsamecounts(self,c):
+    features=set()
+    for item,cat in self.docs: features.update(docclass.getwords(item))
+    for cat in ['good','bad']:
+      self.assertEqual(c.catcount(cat),self.expected.catcount(cat))
+      for f in features:
+        self.assertEqual(c.fcount(f,cat),self.expected.fcount(f,cat))
+
+  def testpool(self):
+    c=docclass.classifier(docclass.getwords)
+    trained=c.trainmany(self.docs,processes=2,batchsize=7,chunksize=3,verbose=False)
+    self.assertEqual(trained,len(self.docs))
+    self.assertsamecounts(c)
+
+  # A run that stops part way carries on from its last batch
+  def testcheckpoint(self):
+    dbfile=os.path.join(self.dir,'test.db')
+    c=docclass.classifier(docclass.getwords)
+    c.setdb(dbfile)
+    self.assertRaises(stopped,c.trainmany,interrupted(self.docs,23),processes=1,
+                      batchsize=10,checkpoint='run',verbose=False)
+    c.store.close()
+
+    c=docclass.classifier(docclass.getwords)
+    c.setdb(dbfile)
+    trained=c.trainmany(self.docs,processes=2,batchsize=10,chunksize=3,
+                        checkpoint='run',verbose=False)
+    self.assertEqual(trained,len(self.docs)-20)
+    self.assertsamecounts(c)
+
+if __name__=='__main__':
+  unittest.main()
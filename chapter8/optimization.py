@@ -1,6 +1,10 @@
 import time
 import random
 import math
+import csv
+import json
+import numpy as np
+from multiprocessing import Pool,cpu_count
 
 people = [('Seymour','BOS'),
           ('Franny','DAL'),
@@ -69,25 +73,94 @@ def schedulecost(sol):
   
   return totalprice+totalwait
 
-def randomoptimize(domain,costf):
+# Keeps a trace of an optimizer run, as in chapter 5. Pass one to an
+# optimizer as recorder= and it adds a row after every iteration with
+# the cost it is at, the best cost so far, how many costs have been
+# worked out and how many were found in a cache, the seconds since the
+# start and how many of them were spent in costf.
+class recorder:
+  fields=['iteration','cost','best','evals','hits','seconds','costseconds']
+
+  def __init__(self,name=''):
+    self.name=name
+    self.rows=[]
+    self.best=None
+    self.evals=0
+    self.hits=0
+    self.costseconds=0.0
+    self.start=time.time()
+
+  # costf, counting and timing the costs worked out with it. This is
+  # when the run starts.
+  def watch(self,costf):
+    self.start=time.time()
+    return timedcost(self,costf)
+
+  def record(self,iteration,cost,hits=0):
+    cost=float(cost)
+    if self.best==None or cost<self.best: self.best=cost
+    self.hits+=hits
+    self.rows.append([iteration,cost,self.best,self.evals,self.hits,
+                      time.time()-self.start,self.costseconds])
+
+  def tojson(self,path):
+    out=open(path,'w')
+    json.dump({'name':self.name,'fields':self.fields,'rows':self.rows},out)
+    out.close()
+
+  def tocsv(self,path):
+    out=open(path,'wb')
+    writer=csv.writer(out)
+    writer.writerow(self.fields)
+    writer.writerows(self.rows)
+    out.close()
+
+# A cost function that tells a recorder about every cost it works out
+class timedcost:
+  def __init__(self,recorder,costf):
+    self.recorder=recorder
+    self.costf=costf
+    if getattr(costf,'batch',None)!=None: self.batch=self.timedbatch
+
+  def count(self,n,start):
+    self.recorder.evals+=n
+    self.recorder.costseconds+=time.time()-start
+
+  def __call__(self,sol):
+    start=time.time()
+    cost=self.costf(sol)
+    self.count(1,start)
+    return cost
+
+  def timedbatch(self,sols):
+    start=time.time()
+    costs=self.costf.batch(sols)
+    self.count(len(sols),start)
+    return costs
+
+def randomoptimize(domain,costf,recorder=None):
+  if recorder!=None: costf=recorder.watch(costf)
   best=999999999
   bestr=None
-  for i in range(0,1000):
-    # Create a random solution
-    r=[float(random.randint(domain[i][0],domain[i][1])) 
-       for i in range(len(domain))]
-    
-    # Get the cost
-    cost=costf(r)
-    
-    # Compare it to the best one so far
-    if cost<best:
-      best=cost
-      bestr=r 
-  return r
+  # Random solutions, scored a chunk at a time so the trace shows how
+  # the best cost went down
+  for start in range(0,1000,50):
+    sols=[[float(random.randint(domain[i][0],domain[i][1]))
+           for i in range(len(domain))] for j in range(start,start+50)]
+    costs=getcosts(costf,sols)
+    if recorder!=None: recorder.record(start/50,min(costs))
+
+    for r,cost in zip(sols,costs):
+      # Compare it to the best one so far
+      if cost<best:
+        best=cost
+        bestr=r 
+  return bestr
 
 
-def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1):
+def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1,recorder=None,
+                      verbose=True):
+  if recorder!=None: costf=recorder.watch(costf)
   # Initialize the values randomly
   vec=[float(random.randint(domain[i][0],domain[i][1])) 
        for i in range(len(domain))]
@@ -110,59 +183,111 @@ def annealingoptimize(domain,costf,T=10000.0,cool=0.95,step=1):
     eb=costf(vecb)
     p=pow(math.e,(-eb-ea)/T)
 
-    print vec,ea
+    if verbose: print vec,ea
 
 
     # Is it better, or does it make the probability
     # cutoff?
     if (eb<ea or random.random()<p):
       vec=vecb      
+      ea=eb
+    if recorder!=None: recorder.record(len(recorder.rows),ea)
 
     # Decrease the temperature
     T=T*cool
   return vec
 
-def swarmoptimize(domain,costf,popsize=20,lrate=0.1,maxv=2.0,iters=50):
-  # Initialize individuals
-  # current solutions
-  x=[]
+# Scores a list of solutions with costf, all at once if it has a
+# batch form (costf.batch), or spread over pool, which has processes
+# workers
+def getcosts(costf,sols,pool=None,processes=1):
+  batch=getattr(costf,'batch',None)
+  if batch!=None and len(sols)>0: return batch(sols)
+  if pool!=None:
+    start=time.time()
+    costs=pool.map(poolcost,sols,max(1,len(sols)/(4*processes)))
+    # The workers' counts don't come back
+    if isinstance(costf,timedcost): costf.count(len(sols),start)
+    return costs
+  return [costf(sol) for sol in sols]
 
-  # best solutions
-  p=[]
+# The pool's workers score solutions with the costf they were started
+# with, since cost functions made by closures can't be pickled
+poolcostf=None
 
+def poolcost(sol):
+  return poolcostf(sol)
+
+# A pool whose workers use costf, or None to work in this process
+def startpool(costf,processes):
+  global poolcostf
+  poolcostf=costf
+  if processes==1: return None
+  return Pool(processes)
+
+# How many workers startpool starts for processes
+def poolsize(processes):
+  if processes==None: return cpu_count()
+  return processes
+
+def stoppool(pool):
+  if pool!=None:
+    pool.close()
+    pool.join()
+
+# Particle swarm optimization. Every particle is pulled towards the best
+# solution it has found and the best any particle has found. The whole
+# swarm moves as one array each iteration and is scored in one go, and
+# each particle's best cost is kept so that only the new positions are
+# scored. With processes other than 1 they are scored in a pool of
+# processes (None for one per CPU). Stops after iters iterations, or
+# once the best cost hasn't improved by more than tol for patience
+# iterations in a row (patience=None to always run iters).
+def swarmoptimize(domain,costf,popsize=20,lrate=0.1,maxv=2.0,iters=50,
+                  processes=1,tol=1e-9,patience=20,recorder=None,verbose=True):
+  if recorder!=None: costf=recorder.watch(costf)
+  low=np.array([d[0] for d in domain],dtype=float)
+  high=np.array([d[1] for d in domain],dtype=float)
+
+  # current solutions
+  x=np.array([[float(random.randint(domain[i][0],domain[i][1]))
+               for i in range(len(domain))] for j in range(popsize)])
   # velocities
-  v=[]
-  
-  for i in range(0,popsize):
-    vec=[float(random.randint(domain[i][0],domain[i][1])) 
-         for i in range(len(domain))]
-    x.append(vec)
-    p.append(vec[:])
-    v.append([0.0 for i in vec])
-  
-  
-  for ml in range(0,iters):
-    for i in range(0,popsize):
-      # Best solution for this particle
-      if costf(x[i])<costf(p[i]):
-        p[i]=x[i][:]
-      g=i
-
-      # Best solution for any particle
-      for j in range(0,popsize):
-        if costf(p[j])<costf(p[g]): g=j
-      for d in range(len(x[i])):
-        # Update the velocity of this particle
-        v[i][d]+=lrate*(p[i][d]-x[i][d])+lrate*(p[g][d]-x[i][d])
-
-        # constrain velocity to a maximum
-        if v[i][d]>maxv: v[i][d]=maxv
-        elif v[i][d]<-maxv: v[i][d]=-maxv
-
-        # constrain bounds of solutions
-        x[i][d]+=v[i][d]
-        if x[i][d]<domain[d][0]: x[i][d]=domain[d][0]
-        elif x[i][d]>domain[d][1]: x[i][d]=domain[d][1]
-
-    print p[g],costf(p[g])
-  return p[g]
+  v=np.zeros(x.shape)
+
+  pool=startpool(costf,processes)
+  workers=poolsize(processes)
+  try:
+    # best solutions and their costs
+    p=x.copy()
+    pcost=np.array(getcosts(costf,p.tolist(),pool,workers),dtype=float)
+    g=pcost.argmin()
+    stalled=0
+
+    for ml in range(0,iters):
+      # Update the velocities, constrained to a maximum
+      v+=lrate*(p-x)+lrate*(p[g]-x)
+      np.clip(v,-maxv,maxv,out=v)
+
+      # constrain bounds of solutions
+      x+=v
+      np.clip(x,low,high,out=x)
+
+      # Best solution for each particle, and for any particle
+      cost=np.array(getcosts(costf,x.tolist(),pool,workers),dtype=float)
+      # the best cost so far, before any particle improves on it
+      best=pcost[g]
+      better=cost<pcost
+      p[better]=x[better]
+      pcost[better]=cost[better]
+      g=pcost.argmin()
+      if recorder!=None: recorder.record(ml,pcost[g])
+
+      if verbose: print p[g].tolist(),pcost[g]
+
+      if best-pcost[g]>tol: stalled=0
+      else: stalled+=1
+      if patience!=None and stalled>=patience: break
+  finally:
+    stoppool(pool)
+  return p[g].tolist()